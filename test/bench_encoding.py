@@ -0,0 +1,302 @@
+"""Benchmark the steganographic encode/decode pipeline.
+
+Cases cover message length, carrier size, the compression stage applied to
+the PNG (none, the pipeline's range coder, zlib) and cold vs warm carrier
+caches. Each case reports throughput and p50/p99 latency; results are
+written as JSON and compared against a stored baseline. The cases use one
+sender/receiver pair, so a carrier sweep also decodes through every
+carrier in the pool and fails if one is far slower than the rest. That
+way a mapping change cannot hide a slow carrier or move the pair onto one.
+Everything runs offline on generated carriers.
+
+Run from the repo root:
+    python test/bench_encoding.py                   # full run, check baseline
+    python test/bench_encoding.py --quick           # fewer cases/iterations
+    python test/bench_encoding.py --update-baseline # record a new baseline
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import string
+import sys
+import time
+import zlib
+
+import numpy as np
+import PIL
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'website'))
+
+from messengersecret.carriers import CarrierPool  # noqa: E402
+from messengersecret.encoding import ImageSteganography  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, 'bench_encoding_baseline.json')
+DEFAULT_OUTPUT = os.path.join(HERE, 'bench_encoding_results.json')
+
+MESSAGE_SIZES = [16, 256, 2048, 16384]
+QUICK_MESSAGE_SIZES = [16, 2048]
+# None = the size class picked for the payload; otherwise a fixed (height, width)
+CARRIER_SIZES = [None, (300, 400), (600, 800)]
+QUICK_CARRIER_SIZES = [None, (600, 800)]
+COMPRESSION = ['none', 'range', 'zlib']
+CACHE_STATES = ['cold', 'warm']
+ITERATIONS = 30
+QUICK_ITERATIONS = 8
+
+SENDER_HASH = 'a1b2c3d4e5f60718293a4b5c6d7e8f90abcdef1234567890abcdef1234567890'
+RECEIVER_HASH = '0f1e2d3c4b5a69788796a5b4c3d2e1f0fedcba0987654321fedcba0987654321'
+
+# A case regresses only if p50 is both this much slower, relatively...
+DEFAULT_TOLERANCE = 0.5
+# ...and this much slower in absolute terms (sub-millisecond cases are noisy)
+MIN_REGRESSION_MS = 0.5
+# Slowest carrier's decode p50 may be at most this multiple of the median carrier's
+CARRIER_SPREAD_LIMIT = 3.0
+CARRIER_SWEEP_CHARS = 2048
+
+
+class FixedSizePool(CarrierPool):
+    """Carrier pool that always embeds into one carrier size"""
+
+    def __init__(self, carrier_size, **kwargs):
+        super().__init__(**kwargs)
+        self.carrier_size = carrier_size
+
+    def size_for(self, payload_bits):
+        if self.carrier_size is None:
+            return super().size_for(payload_bits)
+        height, width = self.carrier_size
+        if height * width * self.shape[2] < payload_bits:
+            raise ValueError("Message too large for the image")
+        return self.carrier_size
+
+
+class BenchSteganography(ImageSteganography):
+    """Pipeline with a selectable compression stage after PNG encoding"""
+
+    def __init__(self, compression, carrier_pool):
+        super().__init__(carrier_pool)
+        self.compression = compression
+
+    def _compress_with_range_encoding(self, data):
+        if self.compression == 'none':
+            return data
+        if self.compression == 'zlib':
+            return zlib.compress(data, 6)
+        return super()._compress_with_range_encoding(data)
+
+    def _decompress_with_range_encoding(self, data):
+        if self.compression == 'none':
+            return data
+        if self.compression == 'zlib':
+            return zlib.decompress(data)
+        return super()._decompress_with_range_encoding(data)
+
+
+def make_message(size):
+    alphabet = string.ascii_letters + string.digits + ' .,!?'
+    words = []
+    rng = random.Random(size)
+    while sum(len(w) + 1 for w in words) < size:
+        words.append(''.join(rng.choices(alphabet, k=rng.randint(1, 9))))
+    return ' '.join(words)[:size]
+
+
+def percentile(samples, q):
+    return float(np.percentile(np.asarray(samples) * 1e3, q))
+
+
+def summarize(samples, message_bytes, stored_bytes):
+    total = sum(samples)
+    return {
+        'iterations': len(samples),
+        'p50_ms': round(percentile(samples, 50), 4),
+        'p99_ms': round(percentile(samples, 99), 4),
+        'ops_per_s': round(len(samples) / total, 2),
+        'mb_per_s': round(len(samples) * message_bytes / total / 1e6, 4),
+        'stored_bytes': stored_bytes,
+    }
+
+
+def run_case(size, carrier_size, compression, cache, iterations):
+    message = make_message(size)
+
+    def new_codec():
+        pool = FixedSizePool(carrier_size)
+        return BenchSteganography(compression, pool)
+
+    codec = new_codec()
+    try:
+        encoded = codec.encode_message(message, SENDER_HASH, RECEIVER_HASH)
+    except ValueError:
+        return None  # message does not fit this carrier
+    if codec.decode_message(encoded, SENDER_HASH, RECEIVER_HASH) != message:
+        raise AssertionError(f'round trip failed for {size} chars / {carrier_size} / {compression}')
+
+    encode_samples = []
+    for _ in range(iterations):
+        if cache == 'cold':
+            # Fresh pool: the carrier has to be generated/loaded again
+            codec = new_codec()
+        start = time.perf_counter()
+        codec.encode_message(message, SENDER_HASH, RECEIVER_HASH)
+        encode_samples.append(time.perf_counter() - start)
+
+    # Decoding never touches the carrier pool, so it has no cold/warm split
+    decode_samples = []
+    if cache == 'warm':
+        for _ in range(iterations):
+            start = time.perf_counter()
+            codec.decode_message(encoded, SENDER_HASH, RECEIVER_HASH)
+            decode_samples.append(time.perf_counter() - start)
+
+    carrier = 'auto' if carrier_size is None else f'{carrier_size[0]}x{carrier_size[1]}'
+    result = {
+        'key': f'{size}/{carrier}/{compression}/{cache}',
+        'message_chars': size,
+        'carrier': carrier,
+        'compression': compression,
+        'cache': cache,
+        'encode': summarize(encode_samples, len(message.encode('utf-8')), len(encoded)),
+    }
+    if decode_samples:
+        result['decode'] = summarize(decode_samples, len(message.encode('utf-8')), len(encoded))
+    return result
+
+
+def pairs_per_carrier(pool):
+    """One (sender_hash, receiver_hash) pair that maps to each carrier index"""
+    pairs = {}
+    n = 0
+    while len(pairs) < len(pool):
+        sender_hash = f'{n:064x}'
+        pairs.setdefault(pool.select(sender_hash, RECEIVER_HASH), (sender_hash, RECEIVER_HASH))
+        n += 1
+    return [pairs[index] for index in range(len(pool))]
+
+
+def carrier_sweep(iterations):
+    """Warm decode p50 (ms) for a size-class message through each carrier of the pool"""
+    message = make_message(CARRIER_SWEEP_CHARS)
+    codec = ImageSteganography(CarrierPool())
+    p50s = []
+    for sender_hash, receiver_hash in pairs_per_carrier(codec.carrier_pool):
+        encoded = codec.encode_message(message, sender_hash, receiver_hash)
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            decoded = codec.decode_message(encoded, sender_hash, receiver_hash)
+            samples.append(time.perf_counter() - start)
+        if decoded != message:
+            raise AssertionError(f'round trip failed through carrier {len(p50s)}')
+        p50s.append(round(percentile(samples, 50), 4))
+    return p50s
+
+
+def check_carrier_spread(p50s):
+    """Regression lines if one carrier decodes far slower than the median carrier"""
+    median = float(np.median(p50s))
+    slowest = int(np.argmax(p50s))
+    if p50s[slowest] > median * CARRIER_SPREAD_LIMIT and p50s[slowest] - median > MIN_REGRESSION_MS:
+        return [f'carrier {slowest} decode: p50 {p50s[slowest]:.3f}ms vs median carrier {median:.3f}ms']
+    return []
+
+
+def compare(results, baseline, tolerance):
+    """List of human-readable regressions against a baseline results file"""
+    previous = {r['key']: r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        old = previous.get(result['key'])
+        if old is None:
+            continue
+        for stage in ('encode', 'decode'):
+            if stage not in result or stage not in old:
+                continue
+            new_p50, old_p50 = result[stage]['p50_ms'], old[stage]['p50_ms']
+            if new_p50 > old_p50 * (1 + tolerance) and new_p50 - old_p50 > MIN_REGRESSION_MS:
+                regressions.append(f"{result['key']} {stage}: p50 {old_p50:.3f}ms -> {new_p50:.3f}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help='Fewer cases and iterations')
+    parser.add_argument('--iterations', type=int, help='Samples per case')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='Where to write JSON results')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline results to compare against')
+    parser.add_argument('--update-baseline', action='store_true', help='Write results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed relative p50 slowdown before failing')
+    args = parser.parse_args()
+
+    sizes = QUICK_MESSAGE_SIZES if args.quick else MESSAGE_SIZES
+    carriers = QUICK_CARRIER_SIZES if args.quick else CARRIER_SIZES
+    iterations = args.iterations or (QUICK_ITERATIONS if args.quick else ITERATIONS)
+
+    results = []
+    print(f"{'case':<34} {'enc p50':>9} {'enc p99':>9} {'enc op/s':>9} {'dec p50':>9} {'dec p99':>9} {'bytes':>8}")
+    for size in sizes:
+        for carrier_size in carriers:
+            for compression in COMPRESSION:
+                for cache in CACHE_STATES:
+                    result = run_case(size, carrier_size, compression, cache, iterations)
+                    if result is None:
+                        continue
+                    results.append(result)
+                    enc, dec = result['encode'], result.get('decode')
+                    dec_cols = f"{dec['p50_ms']:>7.3f}ms {dec['p99_ms']:>7.3f}ms" if dec else f"{'-':>9} {'-':>9}"
+                    print(f"{result['key']:<34} {enc['p50_ms']:>7.3f}ms {enc['p99_ms']:>7.3f}ms "
+                          f"{enc['ops_per_s']:>9.1f} {dec_cols} {enc['stored_bytes']:>8}")
+
+    sweep = carrier_sweep(iterations)
+    print(f"carrier sweep ({CARRIER_SWEEP_CHARS} chars, warm decode p50): "
+          f"median {np.median(sweep):.3f}ms, slowest {max(sweep):.3f}ms (carrier {int(np.argmax(sweep))})")
+    spread = check_carrier_spread(sweep)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pillow': PIL.__version__,
+            'machine': platform.machine(),
+            'quick': args.quick,
+            'iterations': iterations,
+        },
+        'results': results,
+        'carrier_sweep_decode_p50_ms': sweep,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if spread:
+        # Independent of the baseline: never record one with a slow carrier in it
+        print('FAIL: carrier sweep:')
+        for line in spread:
+            print(f'  {line}')
+        sys.exit(1)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against; run with --update-baseline to record one")
+        return
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    if regressions:
+        print('FAIL: regressions against baseline:')
+        for line in regressions:
+            print(f'  {line}')
+        sys.exit(1)
+    print('OK: no regressions against baseline')
+
+if __name__ == '__main__':
+    main()
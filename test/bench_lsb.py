@@ -0,0 +1,91 @@
+"""Benchmark the NumPy bit-plane engine against the old string-based LSB loops.
+
+Run from the repo root:  python test/bench_lsb.py
+"""
+import os
+import random
+import string
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'website'))
+
+from messengersecret.bitplane import embed_bytes, extract_until_delimiter  # noqa: E402
+
+SIZES = [1024, 4096, 10240]
+REPEATS = 3
+MIN_SPEEDUP = 10.0
+
+
+def legacy_encode(flat_pixels, message):
+    binary_message = ''.join(format(ord(char), '08b') for char in message)
+    binary_message += '00000000'
+    for i in range(len(binary_message)):
+        # ~1 overflows uint8 under NumPy 2; 0xFE is the same mask
+        flat_pixels[i] = (flat_pixels[i] & 0xFE) | int(binary_message[i])
+    return flat_pixels
+
+
+def legacy_decode(flat_pixels):
+    binary_message = ''
+    for pixel in flat_pixels:
+        binary_message += str(pixel & 1)
+        if len(binary_message) >= 8 and binary_message[-8:] == '00000000':
+            break
+    message_bytes = bytearray()
+    for i in range(0, len(binary_message) - 8, 8):
+        message_bytes.append(int(binary_message[i:i + 8], 2))
+    return bytes(message_bytes)
+
+
+def best_of(fn, *args):
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    rng = np.random.default_rng(0)
+    carrier = rng.integers(0, 256, 600 * 800 * 3, dtype=np.uint8)
+    # Chat-like text; no pair of these characters contains 8 consecutive zero
+    # bits, so the delimiter scan runs over the whole message
+    alphabet = string.ascii_letters + string.digits + ' .,!?'
+    failed = False
+
+    print(f"{'size':>8} {'legacy enc':>12} {'numpy enc':>12} {'x':>6} {'legacy dec':>12} {'numpy dec':>12} {'x':>6}")
+    for size in SIZES:
+        message = ''.join(random.Random(size).choices(alphabet, k=size))
+        payload = message.encode('latin-1') + b'\x00'
+
+        legacy_pixels = legacy_encode(carrier.copy(), message)
+        numpy_pixels = embed_bytes(carrier.copy(), payload)
+        if not np.array_equal(legacy_pixels, numpy_pixels):
+            print(f"{size}: encoded pixels differ from legacy output")
+            failed = True
+        if legacy_decode(legacy_pixels) != extract_until_delimiter(numpy_pixels):
+            print(f"{size}: decoded bytes differ from legacy output")
+            failed = True
+
+        t_le = best_of(legacy_encode, carrier.copy(), message)
+        t_ne = best_of(embed_bytes, carrier.copy(), payload)
+        t_ld = best_of(legacy_decode, legacy_pixels)
+        t_nd = best_of(extract_until_delimiter, numpy_pixels)
+        enc_x, dec_x = t_le / t_ne, t_ld / t_nd
+        print(f"{size:>8} {t_le * 1e3:>10.2f}ms {t_ne * 1e3:>10.3f}ms {enc_x:>6.0f} "
+              f"{t_ld * 1e3:>10.2f}ms {t_nd * 1e3:>10.3f}ms {dec_x:>6.0f}")
+        if enc_x < MIN_SPEEDUP or dec_x < MIN_SPEEDUP:
+            failed = True
+
+    if failed:
+        print(f"FAIL: expected identical output and at least {MIN_SPEEDUP:.0f}x speedup")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark the payload compression stage on chat-like text.
+
+For each message length and codec choice this reports the framed payload
+size, the carrier size class it needs and p50 encode/decode latency, so
+the effect of compressing before embedding is visible end to end.
+
+Run from the repo root:  python test/bench_payload.py
+"""
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'website'))
+
+from messengersecret import frame, payload_codecs  # noqa: E402
+from messengersecret.carriers import size_class_for  # noqa: E402
+from messengersecret.encoding import ImageSteganography  # noqa: E402
+
+ITERATIONS = 15
+CODEC_SETS = {
+    'raw': (),
+    'zlib': (frame.CODEC_ZLIB,),
+    'rle': (frame.CODEC_RLE,),
+    'range': (frame.CODEC_RANGE,),
+    'auto': payload_codecs.DEFAULT_CODECS,
+}
+
+PHRASES = [
+    'hey', 'are you around later?', 'lol', 'ok sounds good', 'running 10 min late sorry',
+    'did you see the email from the organisers?', 'haha yes', 'noooooo way', 'see you at 6',
+    'can you send me the link again', 'https://example.com/slides/week-3.pdf', 'thanks!!',
+    'I think the demo crashed because the database was locked again', 'meeting moved to room 204',
+    'good luck with the presentation 🎉', 'on my way', 'what time does the hackathon finish?',
+]
+
+
+def chat_text(length, seed):
+    """Chat-like text: short lines from a shared vocabulary, some repetition, a few emoji"""
+    rng = random.Random(seed)
+    lines = []
+    while sum(len(line) + 1 for line in lines) < length:
+        lines.append(rng.choice(PHRASES))
+    return '\n'.join(lines)[:length]
+
+
+def p50_ms(fn, *args):
+    samples = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return float(np.percentile(samples, 50)) * 1e3
+
+
+def main():
+    failed = False
+    print(f"{'chars':>6} {'codecs':<6} {'codec':>5} {'payload':>8} {'carrier':>9} {'enc p50':>9} {'dec p50':>9}")
+    for length in (40, 400, 2000, 16000):
+        message = chat_text(length, length)
+        raw_size = None
+        for name, codecs in CODEC_SETS.items():
+            codec = ImageSteganography(codecs=codecs)
+            payload = codec._message_payload(message)
+            header = frame.parse_header(payload)
+            height, width = size_class_for(len(payload) * 8)
+            encoded = codec.encode_message(message, 'sender', 'receiver')
+            if codec.decode_message(encoded) != message:
+                print(f"{length} {name}: round trip failed")
+                failed = True
+            if name == 'raw':
+                raw_size = len(payload)
+            elif name == 'auto' and len(payload) > raw_size:
+                print(f"{length}: automatic choice is larger than raw")
+                failed = True
+            enc = p50_ms(codec.encode_message, message, 'sender', 'receiver')
+            dec = p50_ms(codec.decode_message, encoded)
+            print(f"{length:>6} {name:<6} {header.codec:>5} {len(payload):>8} {f'{height}x{width}':>9} "
+                  f"{enc:>7.2f}ms {dec:>7.2f}ms")
+
+    if failed:
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
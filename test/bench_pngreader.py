@@ -0,0 +1,120 @@
+"""Benchmark PngRowReader's partial decode for every PNG filter type.
+
+PIL's encoder picks row filters itself, so the bench writes its own PNGs
+with every row forced to one filter (None, Sub, Up, Average, Paeth) and
+checks that reading the first rows' LSB payload is correct and faster
+than letting PIL decode the whole image.
+
+Run from the repo root:  python test/bench_pngreader.py
+"""
+import io
+import os
+import struct
+import sys
+import time
+import zlib
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'website'))
+
+from messengersecret.bitplane import embed_bytes, extract_bytes  # noqa: E402
+from messengersecret.carriers import generate_carrier  # noqa: E402
+from messengersecret.pngreader import PNG_SIGNATURE, PngRowReader  # noqa: E402
+
+FILTERS = {0: 'none', 1: 'sub', 2: 'up', 3: 'average', 4: 'paeth'}
+SHAPES = [(96, 128, 3), (600, 800, 3)]
+PAYLOAD_BYTES = 2048
+REPEATS = 15
+
+
+def filter_rows(pixels, filter_type):
+    """Apply one PNG filter to every row of an (h, w, c) uint8 image"""
+    height, width, bpp = pixels.shape
+    x = pixels.reshape(height, width * bpp).astype(np.int16)
+    a = np.zeros_like(x)
+    a[:, bpp:] = x[:, :-bpp]
+    b = np.zeros_like(x)
+    b[1:] = x[:-1]
+    c = np.zeros_like(x)
+    c[1:, bpp:] = x[:-1, :-bpp]
+    if filter_type == 0:
+        predictor = 0
+    elif filter_type == 1:
+        predictor = a
+    elif filter_type == 2:
+        predictor = b
+    elif filter_type == 3:
+        predictor = (a + b) >> 1
+    else:
+        p = a + b - c
+        pa, pb, pc = np.abs(p - a), np.abs(p - b), np.abs(p - c)
+        predictor = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+    filtered = ((x - predictor) & 0xFF).astype(np.uint8)
+    return np.hstack([np.full((height, 1), filter_type, dtype=np.uint8), filtered]).tobytes()
+
+
+def write_png(pixels, filter_type):
+    height, width, _ = pixels.shape
+
+    def chunk(chunk_type, body):
+        return struct.pack('>I', len(body)) + chunk_type + body + struct.pack('>I', zlib.crc32(chunk_type + body))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (PNG_SIGNATURE + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(filter_rows(pixels, filter_type), 6)) + chunk(b'IEND', b''))
+
+
+def p50_ms(fn, *args):
+    samples = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples)) * 1e3
+
+
+def partial_decode(data, n_bytes):
+    return PngRowReader(data).read_lsb_bytes(n_bytes)
+
+
+def full_decode(data, n_bytes):
+    with Image.open(io.BytesIO(data)) as image:
+        return extract_bytes(np.asarray(image).reshape(-1), n_bytes)
+
+
+def main():
+    failed = False
+    payload = os.urandom(PAYLOAD_BYTES)
+    print(f"{'carrier':>9} {'filter':>8} {'partial':>9} {'full PIL':>9} {'x':>5}")
+    for shape in SHAPES:
+        pixels = generate_carrier(0, shape).copy()
+        embed_bytes(pixels.reshape(-1), payload)
+        for filter_type, name in FILTERS.items():
+            data = write_png(pixels, filter_type)
+            with Image.open(io.BytesIO(data)) as image:
+                if not np.array_equal(np.asarray(image), pixels):
+                    print(f"{shape} {name}: test PNG does not round-trip through PIL")
+                    failed = True
+            reader = PngRowReader(data)
+            rows = reader.read_rows(4)
+            if not np.array_equal(rows, pixels[:4]) or partial_decode(data, PAYLOAD_BYTES) != payload:
+                print(f"{shape} {name}: partial decode differs")
+                failed = True
+            partial = p50_ms(partial_decode, data, PAYLOAD_BYTES)
+            full = p50_ms(full_decode, data, PAYLOAD_BYTES)
+            print(f"{f'{shape[0]}x{shape[1]}':>9} {name:>8} {partial:>7.2f}ms {full:>7.2f}ms {full / partial:>5.1f}")
+            # Small carriers are mostly payload rows; only large ones must win clearly
+            if shape == SHAPES[-1] and partial >= full:
+                print(f"{shape} {name}: partial decode is not faster than a full decode")
+                failed = True
+
+    if failed:
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
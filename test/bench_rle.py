@@ -0,0 +1,110 @@
+"""Benchmark the NumPy RLE module against the string-based bitstream approach.
+
+Compares test/rle.py's image_to_bitstream ('0'/'1' string built with a
+per-pixel lambda) and a groupby run-length pass over that string with
+messengersecret.rle's packed bit-plane and run coder.
+
+Run from the repo root:  python test/bench_rle.py
+"""
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..', 'website'))
+
+from rle import image_to_bitstream as legacy_image_to_bitstream  # noqa: E402
+from messengersecret import rle  # noqa: E402
+
+SIZES = [(120, 160), (480, 640), (960, 1280)]
+REPEATS = 3
+MIN_SPEEDUP = 10.0
+
+
+def legacy_run_lengths(bitstream):
+    """Run lengths of a '0'/'1' string, the way string code would do it"""
+    return bitstream[:1], [len(list(group)) for _, group in itertools.groupby(bitstream)]
+
+
+def make_image(height, width):
+    """Blocky two-tone drawing with some noise: long runs, like a scanned sketch"""
+    rng = np.random.default_rng(height)
+    blocks = rng.integers(0, 2, (height // 16 + 1, width // 16 + 1), dtype=np.uint8) * 255
+    pixels = np.kron(blocks, np.ones((16, 16), dtype=np.uint8))[:height, :width]
+    noise = rng.random((height, width)) < 0.01
+    return Image.fromarray(np.where(noise, 255 - pixels, pixels).astype(np.uint8), 'L')
+
+
+def best_of(fn, *args):
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def numpy_pipeline(path):
+    bits = rle.image_to_bitstream(path, packed=False)
+    return rle.pack_bit_runs(bits)
+
+
+def legacy_pipeline(path):
+    return legacy_run_lengths(legacy_image_to_bitstream(path))
+
+
+def main():
+    failed = False
+    print(f"{'size':>10} {'legacy':>10} {'numpy':>10} {'x':>6} {'bits':>9} {'packed':>8} {'runs':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for height, width in SIZES:
+            path = os.path.join(tmp, f'{height}x{width}.png')
+            make_image(height, width).save(path)
+
+            legacy_bits = legacy_image_to_bitstream(path)
+            numpy_bits = rle.image_to_bitstream(path, packed=False)
+            if legacy_bits != ''.join(map(str, numpy_bits.tolist())):
+                print(f"{height}x{width}: bitstreams differ")
+                failed = True
+            first, legacy_runs = legacy_run_lengths(legacy_bits)
+            numpy_first, numpy_runs = rle.encode_bits(numpy_bits)
+            if legacy_runs != numpy_runs.tolist() or int(first) != numpy_first:
+                print(f"{height}x{width}: run lengths differ")
+                failed = True
+            packed_runs = rle.pack_bit_runs(numpy_bits)
+            if not np.array_equal(rle.unpack_bit_runs(packed_runs), numpy_bits):
+                print(f"{height}x{width}: bit-run round trip failed")
+                failed = True
+
+            t_legacy = best_of(legacy_pipeline, path)
+            t_numpy = best_of(numpy_pipeline, path)
+            speedup = t_legacy / t_numpy
+            packed = rle.image_to_bitstream(path)
+            print(f"{height}x{width:<5} {t_legacy * 1e3:>8.1f}ms {t_numpy * 1e3:>8.2f}ms {speedup:>6.0f} "
+                  f"{len(legacy_bits):>9} {packed.nbytes:>8} {len(packed_runs):>8}")
+            if speedup < MIN_SPEEDUP:
+                failed = True
+
+    # Byte RLE on chat-like text: shrinks repeats, bounded growth otherwise
+    for text in ['hahahahaaaaaaaaaaaa!!!!!!!!!!!! nooooooooo', 'See you at 6, bring the notes please.']:
+        data = text.encode('utf-8')
+        encoded = rle.encode_bytes(data)
+        if rle.decode_bytes(encoded) != data:
+            print(f"byte RLE round trip failed for {text!r}")
+            failed = True
+        print(f"byte RLE {len(data):>4} -> {len(encoded):>4} bytes: {text[:40]!r}")
+
+    if failed:
+        print(f"FAIL: expected identical output and at least {MIN_SPEEDUP:.0f}x speedup")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
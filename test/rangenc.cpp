@@ -118,8 +118,8 @@ public:
         uint64_t range = high - low + 1;
         uint64_t value = ((code - low + 1) * total - 1) / range;
 
-        // Binary search for symbol
-        auto it = std::lower_bound(cum_freqs.begin(), cum_freqs.end(), value);
+        // Binary search for symbol: last cum_freqs entry <= value
+        auto it = std::upper_bound(cum_freqs.begin(), cum_freqs.end(), value);
         int symbol = it - cum_freqs.begin() - 1;
 
         // Update range
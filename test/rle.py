@@ -15,5 +15,7 @@ def image_to_bitstream(image_path):
     bitstream = ''.join(str(bit) for bit in pixels)
     return bitstream
 
-bitstream = image_to_bitstream(".jpg")
-print(bitstream[:64])  # Print first 64 bits
+if __name__ == "__main__":
+    # See website/messengersecret/rle.py for the packed NumPy version
+    bitstream = image_to_bitstream(".jpg")
+    print(bitstream[:64])  # Print first 64 bits
@@ -0,0 +1,398 @@
+"""Asynchronous video-ID prober with a persistent result cache.
+
+Probes random 11-character video IDs by requesting their thumbnail, the
+way youtube_mapping.py does, but built to run for a long time:
+
+- one long-lived aiohttp session and connection pool for the whole run;
+- IDs are generated in the event loop from one os.urandom call per batch,
+  with no executor round trip;
+- every definitive answer (200 found, 404 missing) goes into a SQLite
+  cache, so no ID is probed twice across runs and found IDs survive a
+  restart. Timeouts, 429s and 5xx are not cached and may be retried;
+- concurrency adapts to the server: AIMD on the in-flight limit, backing
+  off when the error rate or latency of the last window rises.
+
+A stub thumbnail server (make_stub_app) lets throughput be measured
+offline. Stub results are fake, so --stub runs use a throwaway cache unless
+--cache names another file, and never the real one (DEFAULT_CACHE), whose
+append-only registry youtube_mapping reads carriers from:
+
+    python test/video_prober.py --stub --count 200
+    python test/video_prober.py --count 10          # real thumbnails
+"""
+import argparse
+import asyncio
+import base64
+import collections
+import multiprocessing
+import os
+import random
+import socket
+import sqlite3
+import statistics
+import tempfile
+import time
+import zlib
+
+import aiohttp
+from aiohttp import web
+
+ID_LENGTH = 11
+VALID_CHARS = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_')
+THUMBNAIL_URL = 'https://img.youtube.com/vi/{}/hqdefault.jpg'
+DEFAULT_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'video_probes.sqlite3')
+
+FOUND, MISSING, ERROR = 'found', 'missing', 'error'
+
+
+def generate_ids(n):
+    """n random IDs over the URL-safe base64 alphabet (9 random bytes -> 12 chars, keep 11)"""
+    encoded = base64.urlsafe_b64encode(os.urandom(9 * n)).decode('ascii')
+    return [encoded[i:i + ID_LENGTH] for i in range(0, len(encoded), 12)]
+
+
+def is_video_id(value):
+    return len(value) == ID_LENGTH and VALID_CHARS.issuperset(value)
+
+
+class ProbeCache:
+    """SQLite record of probed IDs; writes are buffered and flushed in batches"""
+
+    def __init__(self, path=DEFAULT_CACHE, flush_every=200):
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS probes ('
+            ' video_id TEXT PRIMARY KEY,'
+            ' found INTEGER NOT NULL,'
+            ' status INTEGER NOT NULL,'
+            ' probed_at REAL NOT NULL'
+            ') WITHOUT ROWID'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS probes_found ON probes (found) WHERE found')
+        # Append-only carrier registry: found IDs in the order they were found.
+        # Positions never change, so consistent hashing over them is stable
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS carriers ('
+            ' position INTEGER PRIMARY KEY,'
+            ' video_id TEXT NOT NULL UNIQUE'
+            ')'
+        )
+        # Backfill caches written before the registry existed; a no-op after that
+        self.db.execute(
+            'INSERT OR IGNORE INTO carriers (video_id)'
+            ' SELECT video_id FROM probes WHERE found ORDER BY probed_at'
+        )
+        self.db.commit()
+        self.flush_every = flush_every
+        self.pending = []
+
+    def unseen(self, video_ids):
+        """The IDs in video_ids that have no cached result"""
+        video_ids = list(dict.fromkeys(video_ids))
+        placeholders = ','.join('?' * len(video_ids))
+        seen = {row[0] for row in self.db.execute(
+            f'SELECT video_id FROM probes WHERE video_id IN ({placeholders})', video_ids)}
+        seen.update(row[0] for row in self.pending)
+        return [vid for vid in video_ids if vid not in seen]
+
+    def record(self, video_id, found, status):
+        self.pending.append((video_id, int(found), status, time.time()))
+        if len(self.pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.db.executemany('INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?)', self.pending)
+            self.db.executemany('INSERT OR IGNORE INTO carriers (video_id) VALUES (?)',
+                                [(row[0],) for row in self.pending if row[1]])
+            self.db.commit()
+            self.pending = []
+
+    def found(self, limit=None):
+        """Found IDs in registry order, oldest first"""
+        query = 'SELECT video_id FROM carriers ORDER BY position'
+        params = ()
+        if limit is not None:
+            query += ' LIMIT ?'
+            params = (limit,)
+        return [row[0] for row in self.db.execute(query, params)]
+
+    def carrier_count(self):
+        self.flush()
+        return self.db.execute('SELECT COUNT(*) FROM carriers').fetchone()[0]
+
+    def carriers_at(self, positions):
+        """{position: video_id} for registry positions (0-based), by primary key"""
+        self.flush()
+        positions = sorted({int(p) + 1 for p in positions})
+        placeholders = ','.join('?' * len(positions))
+        return {position - 1: video_id for position, video_id in self.db.execute(
+            f'SELECT position, video_id FROM carriers WHERE position IN ({placeholders})', positions)}
+
+    def counts(self):
+        self.flush()
+        return dict(self.db.execute('SELECT found, COUNT(*) FROM probes GROUP BY found').fetchall())
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+class AdaptiveLimit:
+    """In-flight request limit tuned by additive increase / multiplicative decrease.
+
+    Every `window` completions the limit grows by one if the window was
+    healthy, and shrinks by `backoff` if its error rate exceeded
+    `max_error_rate` or its median latency exceeded `latency_factor` times
+    the best median seen so far (i.e. the server started queueing).
+    """
+
+    def __init__(self, initial=16, minimum=1, maximum=256, window=32,
+                 max_error_rate=0.05, latency_factor=2.0, backoff=0.7):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.window = window
+        self.max_error_rate = max_error_rate
+        self.latency_factor = latency_factor
+        self.backoff = backoff
+        self.in_flight = 0
+        self.best_latency = None
+        self.latencies = []
+        self.errors = 0
+        self.adjustments = []
+        self.waiters = collections.deque()
+
+    async def acquire(self):
+        if self.in_flight < self.limit and not self.waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        # release() hands the slot over, counting it in in_flight
+        await waiter
+
+    def release(self, latency, error):
+        self.in_flight -= 1
+        self.latencies.append(latency)
+        self.errors += bool(error)
+        if len(self.latencies) >= self.window:
+            self._adjust()
+        # Wake waiters one per free slot rather than all of them
+        while self.waiters and self.in_flight < self.limit:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _adjust(self):
+        median = statistics.median(self.latencies)
+        error_rate = self.errors / len(self.latencies)
+        # Slowly forgetting minimum: one lucky window must not pin the
+        # baseline forever, but a queueing server must not raise it quickly
+        if self.best_latency is None:
+            self.best_latency = median
+        self.best_latency = min(median, self.best_latency * 1.05)
+        if error_rate > self.max_error_rate or median > self.best_latency * self.latency_factor:
+            self.limit = max(self.minimum, int(self.limit * self.backoff))
+        else:
+            self.limit = min(self.maximum, self.limit + 1)
+        self.adjustments.append(self.limit)
+        self.latencies = []
+        self.errors = 0
+
+
+class VideoProber:
+    """Find existing video IDs; use as `async with VideoProber(...) as prober`"""
+
+    def __init__(self, cache=None, url_template=THUMBNAIL_URL, limit=None,
+                 max_connections=256, timeout=2.0):
+        self.cache = cache or ProbeCache()
+        self.url_template = url_template
+        self.limit = limit or AdaptiveLimit(maximum=max_connections)
+        self.max_connections = max_connections
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+        self.stats = {FOUND: 0, MISSING: 0, ERROR: 0, 'cached': 0}
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+        self.cache.flush()
+
+    async def probe(self, video_id):
+        """FOUND, MISSING or ERROR for one ID, cached unless it is an error"""
+        await self.limit.acquire()
+        start = time.perf_counter()
+        status = 0
+        try:
+            async with self.session.head(self.url_template.format(video_id)) as resp:
+                status = resp.status
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        outcome = FOUND if status == 200 else MISSING if status == 404 else ERROR
+        self.limit.release(time.perf_counter() - start, outcome == ERROR)
+        if outcome != ERROR:
+            self.cache.record(video_id, outcome == FOUND, status)
+        self.stats[outcome] += 1
+        return outcome
+
+    async def probe_many(self, video_ids):
+        """{video_id: outcome} for IDs that were not already cached"""
+        fresh = self.cache.unseen(video_ids)
+        self.stats['cached'] += len(video_ids) - len(fresh)
+        outcomes = await asyncio.gather(*(self.probe(vid) for vid in fresh))
+        return dict(zip(fresh, outcomes))
+
+    async def find(self, n, batch_size=64, on_found=None):
+        """Probe random IDs until n found IDs are cached; returns the first n"""
+        found = len(self.cache.found(limit=n))
+        pending = set()
+        while found < n:
+            # Keep a batch more tasks than the limit queued, so a freed slot
+            # never waits on ID generation or the cache lookup
+            while len(pending) < self.limit.limit + batch_size:
+                for vid in self.cache.unseen(generate_ids(batch_size)):
+                    pending.add(asyncio.ensure_future(self._probe_id(vid)))
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                vid, outcome = task.result()
+                if outcome == FOUND and found < n:
+                    found += 1
+                    if on_found:
+                        on_found(vid, found)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self.cache.flush()
+        return self.cache.found(limit=n)
+
+    async def _probe_id(self, video_id):
+        return video_id, await self.probe(video_id)
+
+
+def make_stub_app(hit_rate=0.05, latency=0.005, capacity=64, error_rate=0.0):
+    """Thumbnail server stand-in for offline runs.
+
+    An ID exists if its CRC-32 falls under hit_rate, so answers are stable
+    across runs. Each request takes `latency` seconds on average
+    (exponentially distributed, like a real network tail), growing in
+    proportion once more than `capacity` requests are in flight, and beyond
+    twice the capacity the server sheds load with 503 - enough for the
+    adaptive limit to find a ceiling. error_rate adds random 500s.
+    """
+    state = {'in_flight': 0, 'requests': 0}
+    threshold = int(hit_rate * 0xFFFFFFFF)
+
+    async def thumbnail(request):
+        video_id = request.match_info['video_id']
+        state['in_flight'] += 1
+        state['requests'] += 1
+        try:
+            if state['in_flight'] > 2 * capacity:
+                return web.Response(status=503)
+            await asyncio.sleep(random.expovariate(1 / latency) * max(1.0, state['in_flight'] / capacity))
+            if random.random() < error_rate:
+                return web.Response(status=500)
+            if is_video_id(video_id) and zlib.crc32(video_id.encode('ascii')) < threshold:
+                return web.Response(status=200, content_type='image/jpeg')
+            return web.Response(status=404)
+        finally:
+            state['in_flight'] -= 1
+
+    app = web.Application()
+    app.router.add_route('*', '/vi/{video_id}/hqdefault.jpg', thumbnail)
+    app['state'] = state
+    return app
+
+
+def serve_stub(sock, ready, **stub_options):
+    """Serve make_stub_app on an already bound socket until killed"""
+    async def signal_ready(app):
+        ready.set()
+
+    app = make_stub_app(**stub_options)
+    app.on_startup.append(signal_ready)
+    web.run_app(app, sock=sock, access_log=None, print=None)
+
+
+def start_stub_server(host='127.0.0.1', **stub_options):
+    """Run the stub in a child process, so it does not compete with the prober
+    for the event loop. Returns (process, url_template)"""
+    sock = socket.socket()
+    sock.bind((host, 0))
+    sock.listen(1024)
+    port = sock.getsockname()[1]
+    context = multiprocessing.get_context('spawn')
+    ready = context.Event()
+    process = context.Process(target=serve_stub, args=(sock, ready), kwargs=stub_options, daemon=True)
+    process.start()
+    sock.close()
+    while not ready.wait(0.1):
+        if not process.is_alive():
+            raise RuntimeError("Stub server exited during startup")
+    return process, f'http://{host}:{port}/vi/{{}}/hqdefault.jpg'
+
+
+async def run(args):
+    stub = None
+    url_template = THUMBNAIL_URL
+    if args.stub:
+        stub, url_template = start_stub_server(
+            hit_rate=args.hit_rate, latency=args.latency, capacity=args.capacity)
+    scratch = None
+    cache_path = args.cache or DEFAULT_CACHE
+    if args.stub and args.cache is None:
+        scratch = tempfile.TemporaryDirectory(prefix='video_prober_stub_')
+        cache_path = os.path.join(scratch.name, 'stub_probes.sqlite3')
+    cache = ProbeCache(cache_path)
+    limit = AdaptiveLimit(initial=args.concurrency, maximum=args.max_concurrency)
+    try:
+        async with VideoProber(cache, url_template, limit, args.max_concurrency) as prober:
+            start = time.perf_counter()
+            found = await prober.find(args.count, on_found=None if args.quiet else
+                                      lambda vid, i: print(f"Found {i} / {args.count}: {vid}"))
+            elapsed = time.perf_counter() - start
+        probes = prober.stats[FOUND] + prober.stats[MISSING] + prober.stats[ERROR]
+        print(f"\n{len(found)} IDs, {probes} probes in {elapsed:.2f}s "
+              f"({probes / elapsed if elapsed else 0:.0f} probes/s)")
+        print(f"found={prober.stats[FOUND]} missing={prober.stats[MISSING]} errors={prober.stats[ERROR]} "
+              f"skipped as cached={prober.stats['cached']}")
+        print(f"concurrency limit: start {args.concurrency}, end {limit.limit}, "
+              f"peak {max(limit.adjustments, default=limit.limit)}")
+        print(f"cache: {cache.counts()}")
+    finally:
+        cache.close()
+        if scratch:
+            scratch.cleanup()
+        if stub:
+            stub.terminate()
+            stub.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=100, help='Found IDs wanted')
+    parser.add_argument('--cache', help=f'SQLite cache path (default {DEFAULT_CACHE}; '
+                                        'a temporary file with --stub)')
+    parser.add_argument('--concurrency', type=int, default=16, help='Initial in-flight limit')
+    parser.add_argument('--max-concurrency', type=int, default=256)
+    parser.add_argument('--stub', action='store_true', help='Probe a local stub server instead')
+    parser.add_argument('--hit-rate', type=float, default=0.05, help='Stub: share of IDs that exist')
+    parser.add_argument('--latency', type=float, default=0.005, help='Stub: seconds per request')
+    parser.add_argument('--capacity', type=int, default=64, help='Stub: requests served without queueing')
+    parser.add_argument('--quiet', action='store_true')
+    args = parser.parse_args()
+    if args.stub and args.cache and os.path.realpath(args.cache) == os.path.realpath(DEFAULT_CACHE):
+        parser.error('--stub would write fake IDs into the real probe cache; use another --cache')
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,9 @@
 ASGI config for messengersecret project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve the site through it (e.g. ``uvicorn messengersecret.asgi:application``)
+to get real-time push: /chat/<contact>/events/ streams conversation events
+from the pub/sub hub as Server-Sent Events.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -14,3 +17,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'messengersecret.settings')
 
 application = get_asgi_application()
+
+# Start background encryption workers once the app registry is ready
+from messengersecret.workers import start_workers  # noqa: E402
+
+start_workers()
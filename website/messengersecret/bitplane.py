@@ -0,0 +1,87 @@
+"""NumPy bit-plane engine for LSB steganography.
+
+Works on bytes and uint8 arrays instead of '0'/'1' strings. Bits are laid
+out MSB-first, one per array element, which is exactly what the original
+``format(ord(char), '08b')`` loop produced, so images written by either
+implementation can be read by the other.
+"""
+import numpy as np
+
+# Number of LSBs inspected per step when scanning for the delimiter
+SCAN_CHUNK_BITS = 1 << 15
+DELIMITER_BITS = 8
+
+
+def bytes_to_bits(payload: bytes) -> np.ndarray:
+    """Unpack bytes into a uint8 array of 0/1 values, MSB first"""
+    return np.unpackbits(np.frombuffer(payload, dtype=np.uint8))
+
+
+def bits_to_bytes(bits: np.ndarray) -> bytes:
+    """Pack a 0/1 array back into bytes, zero-padding the last byte"""
+    return np.packbits(bits).tobytes()
+
+
+def embed_bytes(flat_pixels: np.ndarray, payload: bytes, offset: int = 0) -> np.ndarray:
+    """Write payload bits into the LSBs of flat_pixels in place, starting at offset"""
+    bits = bytes_to_bits(payload)
+    end = offset + bits.size
+    if end > flat_pixels.size:
+        raise ValueError("Message too large for the image")
+    target = flat_pixels[offset:end]
+    np.bitwise_and(target, 0xFE, out=target)
+    np.bitwise_or(target, bits, out=target)
+    return flat_pixels
+
+
+def extract_bits(flat_pixels: np.ndarray, count: int, offset: int = 0) -> np.ndarray:
+    """Return `count` LSBs starting at offset as a 0/1 array"""
+    return flat_pixels[offset:offset + count] & 1
+
+
+def extract_bytes(flat_pixels: np.ndarray, n_bytes: int, offset: int = 0) -> bytes:
+    """Read n_bytes of payload from the LSBs starting at bit offset"""
+    bits = extract_bits(flat_pixels, n_bytes * 8, offset)
+    if bits.size < n_bytes * 8:
+        raise ValueError("Image too small for requested payload")
+    return bits_to_bytes(bits)
+
+
+def _find_zero_run(bits: np.ndarray, run: int) -> int:
+    """Index just past the first run of `run` zero bits, or -1"""
+    if bits.size < run:
+        return -1
+    ones = np.concatenate(([0], np.cumsum(bits, dtype=np.int64)))
+    window = ones[run:] - ones[:-run]
+    hits = np.flatnonzero(window == 0)
+    if hits.size == 0:
+        return -1
+    return int(hits[0]) + run
+
+
+def extract_until_delimiter(flat_pixels: np.ndarray) -> bytes:
+    """Read LSBs up to the first 8-zero-bit run, mirroring the legacy scanner.
+
+    The legacy decoder checked the last 8 bits after every pixel, so the
+    delimiter can match at any bit offset, not just on byte boundaries. It
+    then emitted ceil((end - 8) / 8) bytes. Both quirks are kept so stored
+    messages decode to exactly the same bytes as before.
+    """
+    total = flat_pixels.size
+    start = 0
+    end = -1
+    while start < total:
+        # Overlap by DELIMITER_BITS - 1 so runs spanning chunks are found
+        lo = max(0, start - (DELIMITER_BITS - 1))
+        hi = min(total, start + SCAN_CHUNK_BITS)
+        found = _find_zero_run(flat_pixels[lo:hi] & 1, DELIMITER_BITS)
+        if found != -1:
+            end = lo + found
+            break
+        start = hi
+    if end == -1:
+        end = total
+
+    n_bits = max(0, end - DELIMITER_BITS)
+    n_bytes = (n_bits + 7) // 8
+    return bits_to_bytes(extract_bits(flat_pixels, n_bytes * 8))
@@ -0,0 +1,287 @@
+"""Local carrier image pool for steganography.
+
+Carriers come either from a directory of images or from a deterministic
+pre-generated set, so encoding never touches the network. Decoded pixel
+arrays are kept in a memory-capped LRU.
+
+The carrier for a message is picked from the sender/receiver hashes with
+jump consistent hashing over an append-only registry of carrier files
+(CarrierRegistry). Growing the pool from n to n + 1 carriers moves only
+about 1/(n + 1) of the pairs, and a lookup needs only the pool size, not
+the carrier list. select_many() hashes a whole batch of pairs at once.
+
+Messages are not embedded into the full carrier: it is cropped (or tiled,
+for small source images) to the smallest of ``SIZE_CLASSES`` that holds
+the payload bits plus a safety margin, so PNG encode time and stored size
+follow the message length.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp')
+REGISTRY_NAME = 'carriers.registry'
+DEFAULT_SHAPE = (600, 800, 3)  # height, width, channels - same as the old fallback
+DEFAULT_POOL_SIZE = 16
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+DEFAULT_MARGIN = 0.25  # spare capacity over the payload bits
+
+# Standard carrier sizes (height, width), smallest first, all 3:4 like the
+# default carrier. Fixed classes keep output sizes from leaking exact lengths.
+SIZE_CLASSES = ((24, 32), (48, 64), (96, 128), (192, 256), (300, 400), (600, 800))
+
+
+def size_class_for(payload_bits: int, channels: int = 3, margin: float = DEFAULT_MARGIN):
+    """Smallest (height, width) class whose LSB capacity fits payload_bits plus margin"""
+    needed = int(payload_bits * (1 + margin))
+    for height, width in SIZE_CLASSES:
+        if height * width * channels >= needed:
+            return height, width
+    height, width = SIZE_CLASSES[-1]
+    if height * width * channels >= payload_bits:
+        # Fits without the margin in the largest class
+        return height, width
+    raise ValueError("Message too large for the image")
+
+
+def fit_carrier(pixels: np.ndarray, height: int, width: int) -> np.ndarray:
+    """Crop pixels to height x width, tiling first if the source is smaller"""
+    source_height, source_width = pixels.shape[:2]
+    if source_height < height or source_width < width:
+        reps = (-(-height // source_height), -(-width // source_width), 1)
+        pixels = np.tile(pixels, reps)
+    return pixels[:height, :width]
+
+
+def pair_key(sender_hash, receiver_hash) -> int:
+    """64-bit key for a sender/receiver pair"""
+    combined = f"{sender_hash or ''}{receiver_hash or ''}".encode('utf-8')
+    return int.from_bytes(hashlib.sha256(combined).digest()[:8], 'big')
+
+
+_JUMP_MULTIPLIER = 2862933555777941757
+_MASK64 = (1 << 64) - 1
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Jump consistent hash (Lamping & Veach) of a 64-bit key into range(buckets)"""
+    if buckets <= 0:
+        raise ValueError("buckets must be positive")
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * _JUMP_MULTIPLIER + 1) & _MASK64
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+def jump_hash_many(keys, buckets: int) -> np.ndarray:
+    """jump_hash over an array of uint64 keys; O(log buckets) vectorised passes"""
+    if buckets <= 0:
+        raise ValueError("buckets must be positive")
+    keys = np.array(keys, dtype=np.uint64)
+    result = np.zeros(keys.shape, dtype=np.int64)
+    j = np.zeros(keys.shape, dtype=np.int64)
+    active = np.ones(keys.shape, dtype=bool)
+    multiplier, one = np.uint64(_JUMP_MULTIPLIER), np.uint64(1)
+    while active.any():
+        result[active] = j[active]
+        # uint64 arithmetic wraps, matching the & _MASK64 in jump_hash
+        keys[active] = keys[active] * multiplier + one
+        j[active] = ((result[active] + 1) * ((1 << 31) / ((keys[active] >> np.uint64(33)) + 1.0))).astype(np.int64)
+        active &= j < buckets
+    return result
+
+
+def generate_carrier(index: int, shape=DEFAULT_SHAPE) -> np.ndarray:
+    """Build a smooth pseudo-random RGB carrier for a pool slot.
+
+    A coarse random grid is upscaled bilinearly, so the regions the payload
+    does not touch stay smooth and PNG-compress well.
+    """
+    height, width, channels = shape
+    rng = np.random.default_rng(index)
+    grid = rng.integers(0, 256, (6, 8, channels), dtype=np.uint8)
+    image = Image.fromarray(grid, 'RGB').resize((width, height), Image.BILINEAR)
+    return np.array(image)
+
+
+class CarrierRegistry:
+    """Append-only list of the carrier files in a directory.
+
+    Positions are stored in a manifest (one file name per line, default
+    REGISTRY_NAME inside the directory), so a carrier keeps its index for
+    good and new files are only ever appended - the property jump hashing
+    needs. A missing manifest is created from the sorted directory listing.
+    If the manifest cannot be written, new files are still used for this
+    process and registered again on the next start.
+    """
+
+    def __init__(self, directory, path=None):
+        self.directory = directory
+        self.path = path or os.path.join(directory, REGISTRY_NAME)
+        self.names = []
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as manifest:
+                self.names = [line.rstrip('\n') for line in manifest if line.strip()]
+
+    def __len__(self):
+        return len(self.names)
+
+    def sync(self) -> int:
+        """Append image files not yet registered; returns how many were added"""
+        known = set(self.names)
+        new = sorted(
+            name for name in os.listdir(self.directory)
+            if name.lower().endswith(IMAGE_EXTENSIONS) and name not in known
+        )
+        if new:
+            self.names.extend(new)
+            try:
+                with open(self.path, 'a', encoding='utf-8') as manifest:
+                    manifest.writelines(f"{name}\n" for name in new)
+            except OSError as e:
+                logger.warning("Could not update carrier registry %s: %s", self.path, e)
+        return len(new)
+
+    def paths(self):
+        return [os.path.join(self.directory, name) for name in self.names]
+
+
+class CarrierPool:
+    """Fixed set of carriers with an LRU cache of decoded pixel arrays"""
+
+    def __init__(self, directory=None, size=DEFAULT_POOL_SIZE, shape=DEFAULT_SHAPE,
+                 max_bytes=DEFAULT_CACHE_BYTES, margin=DEFAULT_MARGIN, registry_path=None):
+        self.shape = tuple(shape)
+        self.max_bytes = max_bytes
+        self.margin = margin
+        self.paths = []
+        if directory and os.path.isdir(directory):
+            registry = CarrierRegistry(directory, registry_path)
+            registry.sync()
+            self.paths = registry.paths()
+        self.size = len(self.paths) if self.paths else size
+        if self.size <= 0:
+            raise ValueError("Carrier pool must contain at least one carrier")
+        # Identifies this pool's pickled copies in worker processes
+        self.pool_id = os.urandom(8).hex()
+
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self.size
+
+    # Pickling sends the configuration and carrier list (for worker processes),
+    # not the cached pixels or the lock; the copy starts with an empty cache
+    _RUNTIME_STATE = ('_cache', '_cache_bytes', '_lock', 'hits', 'misses')
+
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if k not in self._RUNTIME_STATE}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def select(self, sender_hash=None, receiver_hash=None) -> int:
+        """Deterministically pick a carrier index for a sender/receiver pair"""
+        return jump_hash(pair_key(sender_hash, receiver_hash), self.size)
+
+    def select_many(self, pairs) -> np.ndarray:
+        """Carrier indices for an iterable of (sender_hash, receiver_hash) pairs"""
+        keys = np.fromiter((pair_key(sender_hash, receiver_hash) for sender_hash, receiver_hash in pairs),
+                           dtype=np.uint64)
+        return jump_hash_many(keys, self.size)
+
+    def _load(self, index: int) -> np.ndarray:
+        if self.paths:
+            try:
+                with Image.open(self.paths[index]) as image:
+                    return np.array(image.convert('RGB'))
+            except OSError as e:
+                # A registered file was removed; its index must stay taken
+                logger.warning("Carrier %s unavailable, using a generated one: %s", self.paths[index], e)
+        return generate_carrier(index, self.shape)
+
+    def get(self, index: int) -> np.ndarray:
+        """Return the cached, read-only pixel array for a carrier"""
+        with self._lock:
+            pixels = self._cache.get(index)
+            if pixels is not None:
+                self._cache.move_to_end(index)
+                self.hits += 1
+                return pixels
+            self.misses += 1
+
+        # Decode outside the lock so other threads are not blocked on disk I/O
+        pixels = self._load(index)
+        pixels.setflags(write=False)
+
+        with self._lock:
+            if index not in self._cache:
+                self._cache[index] = pixels
+                self._cache_bytes += pixels.nbytes
+                # Always keep the newest entry, even if it alone exceeds the cap
+                while self._cache_bytes > self.max_bytes and len(self._cache) > 1:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cache_bytes -= evicted.nbytes
+            return self._cache[index]
+
+    def size_for(self, payload_bits: int):
+        """Carrier (height, width) for a payload of payload_bits"""
+        return size_class_for(payload_bits, self.shape[2], self.margin)
+
+    def sized(self, index: int, payload_bits: int) -> np.ndarray:
+        """Read-only carrier view cropped/tiled to the size class for payload_bits"""
+        return fit_carrier(self.get(index), *self.size_for(payload_bits))
+
+    def acquire(self, sender_hash=None, receiver_hash=None, payload_bits=None) -> np.ndarray:
+        """Writable copy of the carrier assigned to a sender/receiver pair.
+
+        With payload_bits the copy is only as large as the payload needs;
+        without it the full carrier is returned.
+        """
+        pixels = self.get(self.select(sender_hash, receiver_hash))
+        if payload_bits is not None:
+            pixels = fit_carrier(pixels, *self.size_for(payload_bits))
+        return pixels.copy()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool() -> CarrierPool:
+    """Process-wide pool, configured from STEGO_CARRIER_DIR / STEGO_CARRIER_REGISTRY /
+    STEGO_CARRIER_CACHE_MB / STEGO_CARRIER_MARGIN"""
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                cache_mb = int(os.environ.get('STEGO_CARRIER_CACHE_MB', DEFAULT_CACHE_BYTES // (1024 * 1024)))
+                _default_pool = CarrierPool(
+                    directory=os.environ.get('STEGO_CARRIER_DIR'),
+                    max_bytes=cache_mb * 1024 * 1024,
+                    margin=float(os.environ.get('STEGO_CARRIER_MARGIN', DEFAULT_MARGIN)),
+                    registry_path=os.environ.get('STEGO_CARRIER_REGISTRY'),
+                )
+                metrics.register_gauge('carrier_cache_hits', lambda: _default_pool.hits)
+                metrics.register_gauge('carrier_cache_misses', lambda: _default_pool.misses)
+    return _default_pool
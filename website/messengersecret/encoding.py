@@ -1,76 +1,83 @@
-import requests
 import numpy as np
 from PIL import Image
+import atexit
 import io
-import subprocess
-import tempfile
-import os
+import logging
+import threading
 import time
-import random
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import NamedTuple
+
+from .bitplane import embed_bytes, extract_until_delimiter
+from .carriers import get_default_pool, fit_carrier
+from .pngreader import PNG_SIGNATURE, PngRowReader
+from . import frame, metrics, payload_codecs, rangecoder
+
+logger = logging.getLogger(__name__)
+
+# Prefix of stored payloads that _compress_with_range_encoding range-coded
+# (PNG-style: high bit set, CR/LF and EOF bytes to catch text-mode mangling)
+RANGE_SIGNATURE = b'\x89RNG\r\n\x1a\n'
+# Largest decoded/stored size ratio accepted for a range-coded PNG
+MAX_RANGE_EXPANSION = 16
 
 class ImageSteganography:
-    def __init__(self):
-        # List of sample cat image URLs
-        self.cat_urls = [
-            "https://cataas.com/cat",
-            "https://api.thecatapi.com/v1/images/search",
-            "https://placekitten.com/800/600"
-        ]
-        self.rangenc_exe = os.path.join(os.path.dirname(__file__), '..', '..', 'test', 'rangenc.exe')
+    def __init__(self, carrier_pool=None, codecs=payload_codecs.DEFAULT_CODECS):
+        # Local carriers only - encoding never goes to the network
+        self.carrier_pool = carrier_pool or get_default_pool()
+        # Codecs the payload compression stage may pick from; () embeds raw UTF-8
+        self.codecs = tuple(codecs or ())
 
     def _compress_with_range_encoding(self, data: bytes) -> bytes:
-        """Compress data using C++ range encoding executable"""
-        # Skip range encoding for speed - it's too slow for web requests
-        print(f"Skipping range encoding for performance (size: {len(data)} bytes)")
-        return data
+        """Range-code data in-process when the frequency model says it will shrink"""
+        # PNG output is already deflated, so usually this keeps the raw bytes;
+        # the entropy estimate is cheap compared to running the coder for nothing
+        if rangecoder.estimate_compressed_size(data) >= len(data):
+            return data
+        compressed = RANGE_SIGNATURE + rangecoder.compress(data)
+        if len(compressed) >= len(data):
+            return data
+        return compressed
 
     def _decompress_with_range_encoding(self, compressed_data: bytes) -> bytes:
-        """Decompress data using C++ range encoding executable"""
-        # Skip range decoding for performance - return data as-is
-        print(f"Skipping range decoding for performance (size: {len(compressed_data)} bytes)")
-        return compressed_data
+        """Undo _compress_with_range_encoding; raw PNGs are passed through.
 
-    def _get_random_cat_image(self):
-        """Fetch a random cat image from the internet"""
-        try:
-            url = random.choice(self.cat_urls)
-            response = requests.get(url, timeout=5)
-            return Image.open(io.BytesIO(response.content))
-        except:
-            # Fallback to creating a deterministic pattern if download fails
-            width = 800
-            height = 600
-            # Use a 32-bit seed so numpy's MT19937 accepts it. Take lower 32 bits
-            # of the hash slice to ensure deterministic but in-range seed.
-            seed = int(combined_hash[:16], 16) & 0xFFFFFFFF
-            np.random.seed(int(seed))
-            pattern = np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
-            img = Image.fromarray(pattern.astype('uint8'), 'RGB')
-            return img
-
-    def encode_message(self, message: str) -> bytes:
-        """Encode a message into an image using LSB steganography and compress it"""
-        # Convert message to binary
-        binary_message = ''.join(format(ord(char), '08b') for char in message)
-        binary_message += '00000000'  # Add delimiter
+        Anything that is neither a PNG nor marked as range-coded (the XOR
+        fallback, corrupted or legacy rows) raises ValueError at once.
+        """
+        if compressed_data.startswith(PNG_SIGNATURE):
+            return compressed_data
+        if compressed_data.startswith(RANGE_SIGNATURE):
+            body = compressed_data[len(RANGE_SIGNATURE):]
+            # A deflated PNG barely compresses, so a large expansion means corruption
+            return rangecoder.decompress(body, max_length=len(body) * MAX_RANGE_EXPANSION)
+        raise ValueError("Stored payload is neither a PNG nor range-coded")
 
-        # Get carrier image
-        image = self._get_random_cat_image()
-        pixels = np.array(image)
+    def _get_carrier(self, sender_hash=None, receiver_hash=None, payload_bits=None) -> np.ndarray:
+        """Pick the carrier pixels for this sender/receiver pair from the local pool,
+        sized to the payload when payload_bits is given"""
+        with metrics.span('stego_carrier_acquire'):
+            return self.carrier_pool.acquire(sender_hash, receiver_hash, payload_bits)
 
-        if len(binary_message) > pixels.size:
-            raise ValueError("Message too large for the image")
+    def _message_payload(self, message: str) -> bytes:
+        """Compressed UTF-8 text in a length-prefixed, checksummed frame (see frame.py)"""
+        with metrics.span('stego_payload_compress'):
+            codec, payload = payload_codecs.choose(message.encode('utf-8'), self.codecs)
+        return frame.pack(payload, codec)
 
-        # Flatten the pixel array
-        flat_pixels = pixels.flatten()
+    def _decode_payload(self, codec: int, payload: bytes) -> str:
+        return payload_codecs.decode(codec, payload).decode('utf-8')
 
-        # Encode message using LSB
-        for i in range(len(binary_message)):
-            flat_pixels[i] = (flat_pixels[i] & ~1) | int(binary_message[i])
+    def _encode_into(self, pixels: np.ndarray, payload: bytes, message: str,
+                     sender_hash: str = None, receiver_hash: str = None) -> bytes:
+        """Embed payload into pixels (modified in place) and return the stored bytes"""
+        # Encode message using LSB on the flattened bit-plane
+        with metrics.span('stego_embed'):
+            encoded_pixels = embed_bytes(pixels.reshape(-1), payload).reshape(pixels.shape)
 
-        # Reshape back to original dimensions
-        encoded_pixels = flat_pixels.reshape(pixels.shape)
-        
         # Convert back to image
         encoded_image = Image.fromarray(encoded_pixels)
         
@@ -79,13 +86,16 @@ class ImageSteganography:
         try:
             if encoded_image.mode != 'RGB':
                 encoded_image = encoded_image.convert('RGB')
-            encoded_image.save(img_byte_arr, format='PNG')
-            compressed_data = self._compress_with_range_encoding(img_byte_arr.getvalue())
+            with metrics.span('stego_png_encode'):
+                encoded_image.save(img_byte_arr, format='PNG')
+            with metrics.span('stego_compress'):
+                compressed_data = self._compress_with_range_encoding(img_byte_arr.getvalue())
         except Exception as e:
             # If image processing fails, fall back to simple encryption
-            print(f"Image steganography failed: {e}, falling back to simple encryption")
+            logger.warning(f"Image steganography failed: {e}, falling back to simple encryption")
+            metrics.incr('stego_fallbacks')
             import hashlib
-            key = hashlib.sha256((sender_hash + receiver_hash).encode()).digest()
+            key = hashlib.sha256(f"{sender_hash or ''}{receiver_hash or ''}".encode()).digest()
             message_bytes = message.encode('utf-8')
             encrypted = bytearray(len(message_bytes))
             for i, b in enumerate(message_bytes):
@@ -94,58 +104,218 @@ class ImageSteganography:
 
         return compressed_data
 
-    def decode_message(self, compressed_data: bytes) -> str:
-        """Decode a message from a compressed steganographic image"""
+    def encode_message(self, message: str, sender_hash: str = None, receiver_hash: str = None) -> bytes:
+        """Encode a message into an image using LSB steganography and compress it"""
+        payload = self._message_payload(message)
+
+        # Get carrier pixels (a private copy we can write into), only as
+        # large as the payload needs
+        pixels = self._get_carrier(sender_hash, receiver_hash, len(payload) * 8)
+        return self._encode_into(pixels, payload, message, sender_hash, receiver_hash)
+
+    def encode_many(self, items, processes: int = None) -> list:
+        """Encode (message, sender_hash, receiver_hash) tuples, results in input order.
+
+        Messages that map to the same carrier and size class share one
+        scratch buffer: after
+        each message only the pixels its payload touched are restored from
+        the cached carrier, instead of copying the whole image again. With
+        processes > 1 the batch is split across a shared process pool whose
+        workers get a copy of this codec's carrier pool, so the carriers do
+        not change with parallelism. Each result is a BatchResult; one bad
+        message does not fail the batch.
+        """
+        items = [_batch_item(item) for item in items]
+        if processes and processes > 1 and len(items) > 1:
+            return _fan_out(partial(_encode_chunk, pool=self.carrier_pool, codecs=self.codecs), items, processes)
+
+        results = [None] * len(items)
+        payloads = {}
+        by_carrier = {}
+        indices = self.carrier_pool.select_many((sender_hash, receiver_hash) for _, sender_hash, receiver_hash in items)
+        for position, (message, sender_hash, receiver_hash) in enumerate(items):
+            try:
+                payload = self._message_payload(message)
+                size = self.carrier_pool.size_for(len(payload) * 8)
+            except Exception as e:
+                results[position] = BatchResult(None, e)
+                continue
+            payloads[position] = payload
+            by_carrier.setdefault((int(indices[position]), size), []).append(position)
+
+        for (index, (height, width)), positions in by_carrier.items():
+            carrier = np.ascontiguousarray(fit_carrier(self.carrier_pool.get(index), height, width))
+            scratch = carrier.copy()
+            flat_carrier = carrier.reshape(-1)
+            flat_scratch = scratch.reshape(-1)
+            for position in positions:
+                message, sender_hash, receiver_hash = items[position]
+                payload = payloads[position]
+                touched = min(len(payload) * 8, flat_scratch.size)
+                try:
+                    results[position] = BatchResult(
+                        self._encode_into(scratch, payload, message, sender_hash, receiver_hash), None)
+                except Exception as e:
+                    results[position] = BatchResult(None, e)
+                finally:
+                    flat_scratch[:touched] = flat_carrier[:touched]
+        return results
+
+    def decode_message(self, compressed_data: bytes, sender_hash: str = None, receiver_hash: str = None) -> str:
+        """Decode a message from a compressed steganographic image.
+
+        Framed payloads are read from only as many image rows as their
+        length needs; legacy delimiter-terminated payloads are still read
+        from the whole image.
+        """
         try:
             # Decompress the image
-            img_data = self._decompress_with_range_encoding(compressed_data)
-            image = Image.open(io.BytesIO(img_data))
-
-            # Convert to numpy array
-            pixels = np.array(image)
-            flat_pixels = pixels.flatten()
-
-            # Extract LSBs
-            binary_message = ''
-            for pixel in flat_pixels:
-                binary_message += str(pixel & 1)
-                # Check for delimiter
-                if len(binary_message) >= 8 and binary_message[-8:] == '00000000':
-                    break
-
-        # Convert binary to bytes
-        message_bytes = bytearray()
-        for i in range(0, len(binary_message)-8, 8):
-            message_bytes.append(int(binary_message[i:i+8], 2))
-            
-        # Apply RLE decompression
-        rle_decoded = RLECompression.decode(bytes(message_bytes))
-        
-        # Convert back to string
-        return rle_decoded.decode('utf-8')
+            with metrics.span('stego_decompress'):
+                img_data = self._decompress_with_range_encoding(compressed_data)
+            with metrics.span('stego_png_decode'):
+                reader = PngRowReader(img_data)
+                header = frame.parse_header(reader.read_lsb_bytes(frame.HEADER_SIZE))
+                if header is None:
+                    # Legacy layout: one Latin-1 byte per character up to the delimiter
+                    message_bytes = extract_until_delimiter(reader.read_all().reshape(-1))
+                    return message_bytes.rstrip(b'\x00').decode('latin-1')
+                framed = reader.read_lsb_bytes(frame.HEADER_SIZE + header.length)
+
+            payload = frame.verify(header, framed[frame.HEADER_SIZE:])
+        except Exception as e:
+            metrics.incr('stego_decode_failures')
+            raise ValueError(f"Could not read steganographic image: {e}")
+
+        return self._decode_payload(header.codec, payload)
+
+    def frame_version(self, compressed_data: bytes) -> int:
+        """Frame version of a stored payload (0 for the legacy delimiter layout).
+
+        Only the rows holding the frame header are decoded.
+        """
+        try:
+            reader = PngRowReader(self._decompress_with_range_encoding(compressed_data))
+            header = frame.parse_header(reader.read_lsb_bytes(frame.HEADER_SIZE))
+        except Exception as e:
+            raise ValueError(f"Could not read steganographic image: {e}")
+        return header.version if header else 0
+
+    def decode_many(self, items, processes: int = None) -> list:
+        """Decode stored payloads (bytes or (bytes, sender_hash, receiver_hash)) in input order.
+
+        Returns a BatchResult per item, with the exception for items that
+        could not be decoded. processes > 1 splits the batch across a pool.
+        """
+        items = [_batch_item(item) for item in items]
+        if processes and processes > 1 and len(items) > 1:
+            return _fan_out(_decode_chunk, items, processes)
+
+        results = []
+        for data, sender_hash, receiver_hash in items:
+            try:
+                results.append(BatchResult(self.decode_message(data, sender_hash, receiver_hash), None))
+            except Exception as e:
+                results.append(BatchResult(None, e))
+        return results
+
+
+class BatchResult(NamedTuple):
+    """One encode_many/decode_many result: value, or the error that prevented it"""
+    value: object
+    error: Exception = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _batch_item(item):
+    """Accept a bare payload/message or a (value, sender_hash, receiver_hash) tuple"""
+    if isinstance(item, (str, bytes, bytearray, memoryview)):
+        return (item, None, None)
+    value, sender_hash, receiver_hash = item
+    return (value, sender_hash, receiver_hash)
+
+
+# Worker-side copies of the parents' carrier pools, by pool_id, so a reused
+# worker keeps its carrier cache warm between batches
+_worker_pools = OrderedDict()
+WORKER_POOLS_KEPT = 4
+
+
+def _worker_pool(pool):
+    """This worker's copy of a parent's pool (the same carriers and settings)"""
+    cached = _worker_pools.get(pool.pool_id)
+    if cached is None:
+        cached = _worker_pools[pool.pool_id] = pool
+        while len(_worker_pools) > WORKER_POOLS_KEPT:
+            _worker_pools.popitem(last=False)
+    _worker_pools.move_to_end(pool.pool_id)
+    return cached
+
+
+def _encode_chunk(items, pool, codecs=payload_codecs.DEFAULT_CODECS):
+    return ImageSteganography(_worker_pool(pool), codecs).encode_many(items)
+
+
+def _decode_chunk(items):
+    return ImageSteganography().decode_many(items)
+
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def _get_executor(processes):
+    """Shared spawn process pool with at least `processes` workers, reused across batches"""
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers < processes:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            # spawn, not fork: callers may be running threads (see workers.py)
+            _executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+            _executor_workers = processes
+        return _executor
+
+
+@atexit.register
+def _shutdown_executor():
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _fan_out(job, items, processes):
+    """Run job over contiguous chunks in the shared process pool, keeping input order"""
+    chunk_size = -(-len(items) // processes)
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    executor = _get_executor(len(chunks))
+    return [result for chunk in executor.map(job, chunks) for result in chunk]
+
 
 encoding = ImageSteganography().encode_message
 decoding = ImageSteganography().decode_message
+decoding_many = ImageSteganography().decode_many
 
 if __name__ == "__main__":
-    # Example usage
-    import time as timing
+    # Quick round trip; see test/bench_encoding.py for the benchmark suite
     sender_hash = "a1b2c3d4e5f60718293a4b5c6d7e8f90abcdef1234567890abcdef1234567890"
     receiver_hash = "0f1e2d3c4b5a69788796a5b4c3d2e1f0fedcba0987654321fedcba0987654321"
     message = "Hello, this is a secret message hidden in a cat image!"
 
     print(f"Original message length: {len(message)} chars")
 
-    start_time = timing.time()
+    start_time = time.perf_counter()
     encoded_data = encoding(message, sender_hash, receiver_hash)
-    encoding_time = timing.time() - start_time
+    encoding_time = time.perf_counter() - start_time
     print(f"Encoded data size: {len(encoded_data)} bytes")
-    print(f"Encoding time: {encoding_time:.4f}s")
+    print(f"Encoding time: {encoding_time * 1000:.2f}ms")
 
-    start_time = timing.time()
+    start_time = time.perf_counter()
     decoded_message = decoding(encoded_data, sender_hash, receiver_hash)
-    decoding_time = timing.time() - start_time
+    decoding_time = time.perf_counter() - start_time
     print(f"Decoded message: {decoded_message}")
-    print(f"Decoding time: {decoding_time:.4f}s")
+    print(f"Decoding time: {decoding_time * 1000:.2f}ms")
 
     print(f"Round-trip success: {message == decoded_message}")
@@ -0,0 +1,58 @@
+"""Versioned, length-prefixed frame for steganographic payloads.
+
+Layout (big-endian, 12 bytes of header then the payload):
+
+    magic     2 bytes   b'\\x00\\xa7'
+    version   1 byte    FRAME_VERSION
+    codec     1 byte    payload codec id (see payload_codecs.py)
+    length    4 bytes   payload length in bytes
+    checksum  4 bytes   CRC-32 of the payload
+
+The magic starts with a NUL byte, which the legacy delimiter format can
+never begin with (a leading NUL was its end marker), so framed and legacy
+rows are told apart from the first two bytes alone.
+"""
+import struct
+import zlib
+from typing import NamedTuple
+
+MAGIC = b'\x00\xa7'
+FRAME_VERSION = 1
+CODEC_RAW = 0
+CODEC_RLE = 1  # rle.encode_bytes
+CODEC_ZLIB = 2  # raw deflate
+CODEC_RANGE = 3  # rangecoder.compress
+
+HEADER = struct.Struct('>2sBBII')
+HEADER_SIZE = HEADER.size
+
+
+class FrameHeader(NamedTuple):
+    version: int
+    codec: int
+    length: int
+    checksum: int
+
+
+def pack(payload: bytes, codec: int = CODEC_RAW) -> bytes:
+    """Frame payload for embedding"""
+    return HEADER.pack(MAGIC, FRAME_VERSION, codec, len(payload), zlib.crc32(payload)) + payload
+
+
+def parse_header(data: bytes):
+    """FrameHeader for the first HEADER_SIZE bytes, or None if they are not a frame"""
+    if len(data) < HEADER_SIZE or not data.startswith(MAGIC):
+        return None
+    magic, version, codec, length, checksum = HEADER.unpack_from(data)
+    if version > FRAME_VERSION:
+        raise ValueError(f"Unsupported frame version {version}")
+    return FrameHeader(version, codec, length, checksum)
+
+
+def verify(header: FrameHeader, payload: bytes) -> bytes:
+    """Return payload if it matches the header, else raise ValueError"""
+    if len(payload) != header.length:
+        raise ValueError(f"Truncated frame: expected {header.length} bytes, got {len(payload)}")
+    if zlib.crc32(payload) != header.checksum:
+        raise ValueError("Frame checksum mismatch")
+    return payload
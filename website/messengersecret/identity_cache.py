@@ -0,0 +1,244 @@
+"""Process-local cache of user identities: (id, username, email, user_hash).
+
+A chat request resolves the contact by email or username, then needs both
+users' hashes for encoding. Without the cache that is two User queries and
+two UserProfile get_or_create calls per request. Entries are kept in an
+LRU bounded by entry count, expire after a TTL, and are dropped when a
+User or UserProfile is saved or deleted in this process. Other processes
+(and queryset.update()/bulk_create(), which send no signals) are bounded
+by the TTL. Failed lookups are not cached, so new users are found at once.
+
+Loads run outside the lock, so an invalidation can land between reading a
+user and caching the result. Every invalidation bumps a generation
+counter; a load only stores its result if the counter has not moved since
+it started, so a stale identity is never cached after its invalidation.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+
+from . import metrics
+from .models import UserProfile
+
+User = get_user_model()
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TTL = 300  # seconds
+
+_FIELDS = ('id', 'username', 'email', 'profile__id', 'profile__user_hash')
+
+
+class Identity(NamedTuple):
+    id: int
+    username: str
+    email: str
+    profile_id: int
+    user_hash: str
+
+
+class IdentityCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # (kind, value) -> (expires_at, Identity); kind is 'lookup', 'username' or 'id'
+        self._entries = OrderedDict()
+        self._keys_by_id = {}  # user id -> keys pointing at it
+        self._lock = threading.Lock()
+        self._generation = 0  # bumped by every invalidate()/clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, identifier):
+        """Identity for an email, falling back to username (like views.find_user), or None"""
+        return self._get(('lookup', identifier), lambda: self._load_lookup(identifier))
+
+    def by_username(self, username):
+        return self._get(('username', username), lambda: self._load_one(username=username))
+
+    def by_id(self, user_id):
+        return self._get(('id', user_id), lambda: self._load_one(id=user_id))
+
+    def many_by_username(self, usernames) -> dict:
+        """{username: Identity} for the known usernames, one query for all misses"""
+        return self._get_many('username', usernames)
+
+    def many_by_id(self, user_ids) -> dict:
+        """{user id: Identity} for the known ids, one query for all misses"""
+        return self._get_many('id', user_ids)
+
+    def invalidate(self, user_id, *identifiers):
+        """Drop every entry for user_id, plus lookups of the given usernames/emails
+        (a new or renamed user can shadow a cached lookup of another user)"""
+        with self._lock:
+            self._generation += 1
+            for key in self._keys_by_id.pop(user_id, ()):
+                self._entries.pop(key, None)
+            for identifier in identifiers:
+                for key in (('lookup', identifier), ('username', identifier)):
+                    self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._keys_by_id.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    # Cache internals
+
+    def _cached(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            self._discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _get(self, key, load):
+        with self._lock:
+            identity = self._cached(key, time.monotonic())
+            if identity is not None:
+                self.hits += 1
+                return identity
+            self.misses += 1
+            generation = self._generation
+        # Query outside the lock so other threads are not blocked on the DB
+        identity = load()
+        if identity is not None:
+            self._put(key, identity, generation)
+        return identity
+
+    def _get_many(self, kind, values) -> dict:
+        found = {}
+        missing = []
+        with self._lock:
+            now = time.monotonic()
+            for value in set(values):
+                identity = self._cached((kind, value), now)
+                if identity is None:
+                    missing.append(value)
+                else:
+                    found[value] = identity
+            self.hits += len(found)
+            self.misses += len(missing)
+            generation = self._generation
+        if missing:
+            for identity in self._load(**{f'{kind}__in': missing}):
+                value = getattr(identity, kind)
+                found[value] = identity
+                self._put((kind, value), identity, generation)
+        return found
+
+    def _put(self, key, identity, generation):
+        """Cache identity unless an invalidation happened since generation was read"""
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + self.ttl, identity)
+            self._keys_by_id.setdefault(identity.id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                evicted_key, (_, evicted) = self._entries.popitem(last=False)
+                self._unindex(evicted_key, evicted.id)
+                self.evictions += 1
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._unindex(key, entry[1].id)
+
+    def _unindex(self, key, user_id):
+        keys = self._keys_by_id.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_id[user_id]
+
+    # Loading
+
+    def _load(self, *args, **filters):
+        identities = []
+        for user_id, username, email, profile_id, user_hash in (
+                User.objects.filter(*args, **filters).order_by('id').values_list(*_FIELDS)):
+            if user_hash is None:
+                # Users created before profiles existed, or by createsuperuser
+                profile, _ = UserProfile.objects.get_or_create(
+                    user_id=user_id, defaults={'user_hash': UserProfile.make_user_hash(username)})
+                profile_id, user_hash = profile.id, profile.user_hash
+            identities.append(Identity(user_id, username, email, profile_id, user_hash))
+        return identities
+
+    def _load_one(self, **filters):
+        identities = self._load(**filters)
+        return identities[0] if identities else None
+
+    def _load_lookup(self, identifier):
+        # One query for both sides of the email-then-username fallback
+        identities = self._load(Q(email=identifier) | Q(username=identifier))
+        for identity in identities:
+            if identity.email == identifier:
+                return identity
+        return identities[0] if identities else None
+
+
+def as_user(identity: Identity):
+    """User instance for an identity, with .profile preloaded; no query is made.
+
+    Only id, username and email are loaded; other fields are deferred and
+    are fetched if accessed.
+    """
+    user = User.from_db(DEFAULT_DB_ALIAS, ['id', 'username', 'email'],
+                        [identity.id, identity.username, identity.email])
+    attach_profile(user, identity)
+    return user
+
+
+def attach_profile(user, identity: Identity):
+    """Preload user.profile from an identity, so templates do not query for it"""
+    user.profile = UserProfile.from_db(DEFAULT_DB_ALIAS, ['id', 'user_id', 'user_hash'],
+                                       [identity.profile_id, identity.id, identity.user_hash])
+
+
+identity_cache = IdentityCache(
+    max_entries=getattr(settings, 'IDENTITY_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES),
+    ttl=getattr(settings, 'IDENTITY_CACHE_TTL', DEFAULT_TTL),
+)
+
+for _stat in ('entries', 'hits', 'misses', 'evictions'):
+    metrics.register_gauge(f'identity_cache_{_stat}', lambda stat=_stat: identity_cache.stats()[stat])
+
+
+def _user_changed(sender, instance, **kwargs):
+    identity_cache.invalidate(instance.pk, instance.username, instance.email)
+
+
+def _profile_changed(sender, instance, **kwargs):
+    identity_cache.invalidate(instance.user_id)
+
+
+post_save.connect(_user_changed, sender=User, dispatch_uid='identity_cache_user_saved')
+post_delete.connect(_user_changed, sender=User, dispatch_uid='identity_cache_user_deleted')
+post_save.connect(_profile_changed, sender=UserProfile, dispatch_uid='identity_cache_profile_saved')
+post_delete.connect(_profile_changed, sender=UserProfile, dispatch_uid='identity_cache_profile_deleted')
@@ -1,25 +1,66 @@
+from itertools import islice
+
 from django.core.management.base import BaseCommand
-from django.contrib.auth import get_user_model
+from django.db.models import Exists, F, OuterRef
+from messengersecret.identity_cache import identity_cache
 from messengersecret.models import Message, Contact
 
-User = get_user_model()
-
 
 class Command(BaseCommand):
     help = 'Backfill Contact rows from existing Message records'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Sender/receiver pairs handled per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Only count pairs that are missing Contact rows')
+
+    def missing_pairs(self):
+        """Distinct (sender, receiver) username pairs without both Contact rows.
+
+        Pairs already backfilled drop out of this query, so an interrupted
+        run simply picks up where it stopped when started again.
+        """
+        forward = Contact.objects.filter(user__username=OuterRef('sender'), contact__username=OuterRef('receiver'))
+        backward = Contact.objects.filter(user__username=OuterRef('receiver'), contact__username=OuterRef('sender'))
+        return (
+            Message.objects.exclude(receiver__isnull=True).exclude(receiver__exact='')
+            .exclude(sender=F('receiver'))
+            .filter(~Exists(forward) | ~Exists(backward))
+            .values_list('sender', 'receiver').order_by('sender', 'receiver').distinct()
+        )
+
     def handle(self, *args, **options):
-        created = 0
+        chunk_size = options['chunk_size']
+        pairs = self.missing_pairs()
+
+        if options['dry_run']:
+            self.stdout.write(f'{pairs.count()} sender/receiver pairs are missing Contact rows')
+            return
+
+        contacts_before = Contact.objects.count()
+        seen = 0
         skipped = 0
-        for m in Message.objects.exclude(receiver__isnull=True).exclude(receiver__exact=''):
-            sender = User.objects.filter(username=m.sender).first()
-            receiver = User.objects.filter(username=m.receiver).first()
-            if sender and receiver:
-                c1, ok1 = Contact.objects.get_or_create(user=sender, contact=receiver)
-                c2, ok2 = Contact.objects.get_or_create(user=receiver, contact=sender)
-                if ok1 or ok2:
-                    created += (1 if ok1 else 0) + (1 if ok2 else 0)
-            else:
-                skipped += 1
-
-        self.stdout.write(self.style.SUCCESS(f'Backfill complete: created {created} contact rows, skipped {skipped} messages'))
+        # One streamed pass over the distinct pairs, handled chunk by chunk
+        stream = pairs.iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(stream, chunk_size))
+            if not chunk:
+                break
+            last = chunk[-1]
+            seen += len(chunk)
+
+            # Users recur across chunks; only ones not seen yet are queried
+            usernames = {name for pair in chunk for name in pair}
+            user_ids = {name: identity.id for name, identity in identity_cache.many_by_username(usernames).items()}
+            rows = []
+            for sender, receiver in chunk:
+                if sender not in user_ids or receiver not in user_ids:
+                    skipped += 1
+                    continue
+                rows.append(Contact(user_id=user_ids[sender], contact_id=user_ids[receiver]))
+                rows.append(Contact(user_id=user_ids[receiver], contact_id=user_ids[sender]))
+            Contact.objects.bulk_create(rows, batch_size=chunk_size, ignore_conflicts=True)
+            self.stdout.write(f'Processed {seen} pairs (up to {last[0]} -> {last[1]})')
+
+        created = Contact.objects.count() - contacts_before
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfill complete: created {created} contact rows, skipped {skipped} pairs with unknown users'))
@@ -0,0 +1,57 @@
+import re
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from messengersecret.models import ConversationSummary
+from messengersecret.views import conversation_messages, messages_after
+
+# Plan lines that mean every row of a hot-path table is visited
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN messengersecret_(message|conversationsummary)\b'),
+    'postgresql': re.compile(r'Seq Scan on messengersecret_(message|conversationsummary)\b'),
+    'mysql': re.compile(r'\btype\W+ALL\b'),
+}
+
+
+def hot_path_queries():
+    """{name: queryset} for the queries every chat page view or poll runs"""
+    alice = SimpleNamespace(username='alice')
+    bob = SimpleNamespace(username='bob')
+    now = timezone.now()
+    conversation = conversation_messages(alice, bob)
+    return {
+        'latest conversation page': conversation.order_by('-timestamp', '-id')[:51],
+        'older conversation page': conversation.filter(
+            Q(timestamp__lt=now) | Q(timestamp=now, id__lt=1000)
+        ).order_by('-timestamp', '-id')[:51],
+        'new messages since': messages_after(alice, bob, 1000)[:50],
+        'contact list': ConversationSummary.objects.filter(user_id=1)
+            .select_related('contact__profile').order_by('-last_message_at'),
+    }
+
+
+def full_scan_pattern():
+    pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+    if pattern is None:
+        raise CommandError(f'No full-scan pattern for database vendor {connection.vendor!r}')
+    return pattern
+
+
+class Command(BaseCommand):
+    help = 'Fail if the chat hot-path queries would full-scan the message or summary tables'
+
+    def handle(self, *args, **options):
+        pattern = full_scan_pattern()
+        failures = []
+        for name, queryset in hot_path_queries().items():
+            plan = queryset.explain()
+            self.stdout.write(f'{name}:\n  ' + plan.replace('\n', '\n  '))
+            if pattern.search(plan):
+                failures.append(name)
+
+        if failures:
+            raise CommandError('Full table scan in: ' + ', '.join(failures))
+        self.stdout.write(self.style.SUCCESS('No full scans on the chat hot path'))
@@ -0,0 +1,344 @@
+import json
+import queue
+import random
+import re
+import threading
+import time
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from messengersecret.encoding import ImageSteganography
+from messengersecret.identity_cache import identity_cache
+from messengersecret.models import Contact, ConversationSummary, Message, UserProfile
+
+User = get_user_model()
+
+SAMPLE_TEXTS = [
+    'hey, are you around later?',
+    'Sure - see you at 6.',
+    'Did you get the notes from the lecture? I missed the second half.',
+    'ok',
+    'Running ten minutes late, sorry!',
+    'That hackathon idea could actually work if we keep the scope small.',
+    'lol',
+    'Can you send me the link again?',
+]
+
+# How the non-send share of replayed requests is split between read endpoints
+READ_MIX = {'conversation': 0.55, 'contacts': 0.15, 'older': 0.15, 'since': 0.15}
+# Cursor the chat page embeds for its first "load older" request
+OLDER_CURSOR_ATTR = re.compile(r'data-older-cursor="([^"]*)"')
+
+
+class Command(BaseCommand):
+    help = 'Seed synthetic users and messages, then replay concurrent read/send traffic against the chat views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Synthetic users to seed')
+        parser.add_argument('--contacts', type=int, default=5, help='Conversations started per user')
+        parser.add_argument('--messages', type=int, default=40, help='Messages seeded per conversation')
+        parser.add_argument('--encrypted-ratio', type=float, default=0.8,
+                            help='Share of seeded messages stored encrypted (the rest as bypassed plain text)')
+        parser.add_argument('--requests', type=int, default=500, help='Requests to replay')
+        parser.add_argument('--concurrency', type=int, default=8, help='Client threads replaying requests')
+        parser.add_argument('--send-ratio', type=float, default=0.2, help='Share of replayed requests that send')
+        parser.add_argument('--prefix', default='loadtest', help='Username prefix for synthetic users')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for data and traffic')
+        parser.add_argument('--skip-seed', action='store_true', help='Replay against previously seeded users')
+        parser.add_argument('--lag-timeout', type=float, default=60.0,
+                            help='Seconds to wait for sent messages to be encrypted')
+        parser.add_argument('--json', dest='json_path', help='Write the report as JSON to this path')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the synthetic users and messages and exit')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['cleanup']:
+            self.cleanup(prefix)
+            return
+
+        rng = random.Random(options['seed'])
+        if not options['skip_seed']:
+            self.seed(options, rng)
+        users = list(User.objects.filter(username__startswith=f'{prefix}_').order_by('id'))
+        if len(users) < 2:
+            raise CommandError(f'No seeded users with prefix {prefix!r}; run without --skip-seed')
+
+        ops = self.plan_traffic(users, options, rng)
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            samples, sent = self.replay(ops, options['concurrency'])
+        lags, unencrypted = self.encryption_lag(sent, options['lag_timeout'])
+        self.report(samples, lags, unencrypted, options)
+
+    # Seeding
+
+    def seed(self, options, rng):
+        prefix = options['prefix']
+        n_users = options['users']
+        if n_users < 2:
+            raise CommandError('--users must be at least 2')
+
+        started = time.perf_counter()
+        existing = set(User.objects.filter(username__startswith=f'{prefix}_').values_list('username', flat=True))
+        password = make_password('loadtest')  # hashing once keeps seeding fast
+        new_users = [
+            User(username=f'{prefix}_{i}', email=f'{prefix}_{i}@example.com', password=password)
+            for i in range(n_users) if f'{prefix}_{i}' not in existing
+        ]
+        User.objects.bulk_create(new_users, batch_size=500)
+        users = list(User.objects.filter(username__startswith=f'{prefix}_').order_by('id'))
+        UserProfile.objects.bulk_create(
+            [UserProfile(user=u, user_hash=UserProfile.make_user_hash(u.username)) for u in users],
+            batch_size=500, ignore_conflicts=True,
+        )
+        # Also warms the identity cache the replayed requests go through
+        hashes = {user_id: identity.user_hash
+                  for user_id, identity in identity_cache.many_by_id(u.id for u in users).items()}
+
+        # Each user starts conversations with the next --contacts users (mod n)
+        pairs = set()
+        for i, user in enumerate(users):
+            for step in range(1, min(options['contacts'], len(users) - 1) + 1):
+                other = users[(i + step) % len(users)]
+                pairs.add((user, other) if user.id < other.id else (other, user))
+        Contact.objects.bulk_create(
+            [Contact(user=a, contact=b) for a, b in pairs] + [Contact(user=b, contact=a) for a, b in pairs],
+            batch_size=500, ignore_conflicts=True,
+        )
+
+        # Encoding is the slow part of seeding; encode a few texts once and reuse the payloads
+        encoded = [r.value for r in ImageSteganography().encode_many(SAMPLE_TEXTS)]
+        seeded = 0
+        summaries = []
+        for a, b in sorted(pairs, key=lambda p: (p[0].id, p[1].id)):
+            key = Message.make_conversation_key(a.username, b.username)
+            if Message.objects.filter(conversation_key=key).exists():
+                continue  # seeded by an earlier run
+            rows = []
+            for _ in range(options['messages']):
+                sender, receiver = (a, b) if rng.random() < 0.5 else (b, a)
+                text_index = rng.randrange(len(SAMPLE_TEXTS))
+                encrypted = rng.random() < options['encrypted_ratio']
+                rows.append(Message(
+                    sender=sender.username,
+                    receiver=receiver.username,
+                    sender_hash=hashes.get(sender.id),
+                    receiver_hash=hashes.get(receiver.id),
+                    content='' if encrypted else SAMPLE_TEXTS[text_index],
+                    payload=encoded[text_index] if encrypted else None,
+                    is_encrypted=encrypted,
+                    encryption_bypassed=not encrypted,
+                    conversation_key=key,
+                ))
+            with transaction.atomic():
+                created = Message.objects.bulk_create(rows)
+            seeded += len(created)
+            last = created[-1] if created else None
+            for user, contact in ((a, b), (b, a)):
+                summaries.append(ConversationSummary(
+                    user=user, contact=contact, last_message=last,
+                    last_message_at=last.timestamp if last else None,
+                ))
+        ConversationSummary.objects.bulk_create(summaries, batch_size=500, ignore_conflicts=True)
+
+        self.stdout.write(f'Seeded {len(new_users)} users, {len(pairs)} conversations, {seeded} messages '
+                          f'in {time.perf_counter() - started:.1f}s')
+
+    def cleanup(self, prefix):
+        usernames = list(User.objects.filter(username__startswith=f'{prefix}_').values_list('username', flat=True))
+        deleted_messages, _ = Message.objects.filter(Q(sender__in=usernames) | Q(receiver__in=usernames)).delete()
+        deleted_users, _ = User.objects.filter(username__in=usernames).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {len(usernames)} users and {deleted_messages} messages'))
+
+    # Replay
+
+    def plan_traffic(self, users, options, rng):
+        """List of (endpoint, user, contact) in replay order"""
+        contacts = {}
+        for user_id, contact in Contact.objects.filter(user__in=users).values_list('user_id', 'contact__email'):
+            contacts.setdefault(user_id, []).append(contact)
+        by_id = {u.id: u for u in users if u.id in contacts}
+        if not by_id:
+            raise CommandError('Seeded users have no contacts')
+
+        endpoints, weights = zip(*READ_MIX.items())
+        ops = []
+        for _ in range(options['requests']):
+            user = by_id[rng.choice(list(by_id))]
+            contact = rng.choice(contacts[user.id])
+            endpoint = 'send' if rng.random() < options['send_ratio'] else rng.choices(endpoints, weights)[0]
+            ops.append((endpoint, user, contact))
+        return ops
+
+    def replay(self, ops, concurrency):
+        work = queue.Queue()
+        for op in ops:
+            work.put(op)
+        # Each worker keeps its own samples, sent ids and cursors; merged after join
+        results = [None] * concurrency
+        # Sends for one (user, contact) pair are serialized, so the newest row
+        # for the pair after a send is that send's own message
+        send_locks = {(user.id, contact): threading.Lock()
+                      for endpoint, user, contact in ops if endpoint == 'send'}
+
+        def worker(index):
+            clients = {}
+            cursors = {}  # (user id, contact) -> older_cursor to page back from
+            samples = []
+            sent = []
+            results[index] = (samples, sent)
+            try:
+                while True:
+                    try:
+                        endpoint, user, contact = work.get_nowait()
+                    except queue.Empty:
+                        return
+                    client = clients.get(user.id)
+                    if client is None:
+                        client = clients[user.id] = Client()
+                        client.force_login(user)
+                    if endpoint == 'send':
+                        with send_locks[user.id, contact]:
+                            sample, sent_message = self.request(client, endpoint, user, contact, cursors)
+                    else:
+                        sample, sent_message = self.request(client, endpoint, user, contact, cursors)
+                    samples.append(sample)
+                    if sent_message:
+                        sent.append(sent_message)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(i,), name=f'loadtest-{i}') for i in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        samples = [sample for thread_samples, _ in results for sample in thread_samples]
+        sent = [message for _, thread_sent in results for message in thread_sent]
+        self.stdout.write(f'Replayed {len(samples)} requests with {concurrency} clients in {elapsed:.1f}s '
+                          f'({len(samples) / elapsed:.1f} req/s)')
+        return samples, sent
+
+    def request(self, client, endpoint, user, contact, cursors):
+        """Issue one request; returns (sample, (message_id, sent_at) or None).
+
+        Like the chat page, 'older' pages back from the cursor of the last
+        conversation or older page this client saw, back to the start.
+        """
+        receiver = None
+        conversation = (user.id, contact)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            try:
+                if endpoint == 'contacts':
+                    response = client.get(reverse('chat'))
+                elif endpoint == 'conversation':
+                    response = client.get(reverse('chat_with_user', args=[contact]))
+                elif endpoint == 'older':
+                    before = cursors.get(conversation)
+                    response = client.get(reverse('older_messages', args=[contact]),
+                                          {'before': before} if before else {})
+                elif endpoint == 'since':
+                    response = client.get(reverse('messages_since', args=[contact]), {'after': 0})
+                else:
+                    receiver = contact.split('@', 1)[0]
+                    response = client.post(reverse('chat_with_user', args=[contact]),
+                                           {'content': random.choice(SAMPLE_TEXTS), 'receiver': receiver})
+                status = response.status_code
+            except Exception as e:
+                status = f'{type(e).__name__}: {e}'
+            elapsed = time.perf_counter() - started
+        sample = {'endpoint': endpoint, 'seconds': elapsed, 'queries': len(queries), 'status': status}
+
+        if status == 200 and endpoint == 'conversation':
+            match = OLDER_CURSOR_ATTR.search(response.content.decode())
+            cursors[conversation] = match.group(1) if match else None
+        elif status == 200 and endpoint == 'older':
+            cursors[conversation] = response.json()['older_cursor']
+
+        sent_message = None
+        if receiver and isinstance(status, int) and status < 400:
+            # Content is cleared once encrypted, so look the row up by its participants
+            message_id = (Message.objects.filter(sender=user.username, receiver=receiver)
+                          .order_by('-id').values_list('id', flat=True).first())
+            if message_id is not None:
+                sent_message = (message_id, time.monotonic() - elapsed)
+        return sample, sent_message
+
+    def encryption_lag(self, sent, timeout):
+        """Seconds from send to is_encrypted for each sent message; plus ids never encrypted"""
+        sent_at = dict(sent)
+        pending = set(sent_at)
+        lags = []
+        deadline = time.monotonic() + timeout
+        while pending and time.monotonic() < deadline:
+            done = set(Message.objects.filter(id__in=pending, is_encrypted=True).values_list('id', flat=True))
+            now = time.monotonic()
+            lags.extend(now - sent_at[message_id] for message_id in done)
+            pending -= done
+            if pending:
+                time.sleep(0.05)
+        return lags, pending
+
+    # Reporting
+
+    def report(self, samples, lags, unencrypted, options):
+        rows = {}
+        for sample in samples:
+            rows.setdefault(sample['endpoint'], []).append(sample)
+
+        result = {'endpoints': {}, 'encryption': {}, 'generated_at': timezone.now().isoformat(),
+                  'options': {k: options[k] for k in ('users', 'contacts', 'messages', 'requests',
+                                                      'concurrency', 'send_ratio', 'seed')}}
+        self.stdout.write(f"\n{'endpoint':<14} {'n':>5} {'err':>4} {'p50 ms':>8} {'p90 ms':>8} "
+                          f"{'p99 ms':>8} {'max ms':>8} {'q avg':>6} {'q max':>6}")
+        for endpoint, group in sorted(rows.items()):
+            ms = np.array([s['seconds'] for s in group]) * 1e3
+            query_counts = [s['queries'] for s in group]
+            errors = [s['status'] for s in group if not isinstance(s['status'], int) or s['status'] >= 400]
+            stats = {
+                'requests': len(group),
+                'errors': len(errors),
+                'p50_ms': round(float(np.percentile(ms, 50)), 2),
+                'p90_ms': round(float(np.percentile(ms, 90)), 2),
+                'p99_ms': round(float(np.percentile(ms, 99)), 2),
+                'max_ms': round(float(ms.max()), 2),
+                'queries_avg': round(sum(query_counts) / len(query_counts), 1),
+                'queries_max': max(query_counts),
+            }
+            if errors:
+                stats['error_samples'] = [str(e) for e in errors[:5]]
+            result['endpoints'][endpoint] = stats
+            self.stdout.write(f"{endpoint:<14} {stats['requests']:>5} {stats['errors']:>4} {stats['p50_ms']:>8.1f} "
+                              f"{stats['p90_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f} "
+                              f"{stats['queries_avg']:>6.1f} {stats['queries_max']:>6}")
+
+        if lags:
+            lag_ms = np.array(lags) * 1e3
+            result['encryption'] = {
+                'encrypted': len(lags),
+                'p50_ms': round(float(np.percentile(lag_ms, 50)), 1),
+                'p99_ms': round(float(np.percentile(lag_ms, 99)), 1),
+                'max_ms': round(float(lag_ms.max()), 1),
+            }
+            self.stdout.write(f"\nEncryption lag: p50 {result['encryption']['p50_ms']:.0f}ms, "
+                              f"p99 {result['encryption']['p99_ms']:.0f}ms, max {result['encryption']['max_ms']:.0f}ms "
+                              f"over {len(lags)} messages")
+        result['encryption']['unencrypted'] = len(unencrypted)
+        if unencrypted:
+            self.stdout.write(self.style.WARNING(
+                f'{len(unencrypted)} sent messages still unencrypted after {options["lag_timeout"]:.0f}s'))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(result, f, indent=2)
+            self.stdout.write(f"Report written to {options['json_path']}")
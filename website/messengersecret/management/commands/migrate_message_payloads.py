@@ -0,0 +1,49 @@
+import base64
+import binascii
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from messengersecret.models import Message
+
+
+class Command(BaseCommand):
+    help = 'Move base64-encoded encrypted message bodies from content into the binary payload column'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows converted per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only count rows that would be converted')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        pending = Message.objects.filter(is_encrypted=True, payload__isnull=True).exclude(content='')
+
+        if options['dry_run']:
+            self.stdout.write(f'{pending.count()} messages would be converted')
+            return
+
+        converted = 0
+        failed = 0
+        last_id = 0
+        while True:
+            # Walk by primary key so each chunk is an index range scan
+            batch = list(pending.filter(id__gt=last_id).order_by('id').only('id', 'content')[:chunk_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            updated = []
+            for m in batch:
+                try:
+                    m.payload = base64.b64decode(m.content.encode('ascii'), validate=True)
+                except (binascii.Error, ValueError):
+                    failed += 1
+                    continue
+                m.content = ''
+                updated.append(m)
+
+            with transaction.atomic():
+                Message.objects.bulk_update(updated, ['payload', 'content'])
+            converted += len(updated)
+            self.stdout.write(f'Converted {converted} messages (up to id {last_id})')
+
+        self.stdout.write(self.style.SUCCESS(f'Payload migration complete: converted {converted}, skipped {failed} undecodable rows'))
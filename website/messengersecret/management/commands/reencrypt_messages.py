@@ -0,0 +1,166 @@
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.utils import OperationalError
+from messengersecret.models import Message
+from messengersecret.workers import reencode_batch
+
+MODES = {
+    # Plain rows left behind by a crash or a saturated queue
+    'unencrypted': lambda: Message.objects.filter(is_encrypted=False, encryption_bypassed=False).exclude(content=''),
+    # Encrypted rows, re-encoded when not in the current frame format
+    'reencode': lambda: Message.objects.filter(is_encrypted=True),
+}
+LOCK_RETRIES = 5
+
+
+class Command(BaseCommand):
+    help = 'Encrypt stuck plain messages or re-encode encrypted ones into the current format, in parallel and resumably'
+
+    def add_arguments(self, parser):
+        parser.add_argument('mode', choices=sorted(MODES), help='Which rows to process')
+        parser.add_argument('--batch-size', type=int, default=200, help='Rows read, encoded and written per batch')
+        parser.add_argument('--processes', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                            help='Encoding worker processes')
+        parser.add_argument('--checkpoint', default='reencrypt_messages.checkpoint.json',
+                            help='File recording the last written id, used to resume')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds to sleep after each written batch so live requests get the database')
+        parser.add_argument('--max-rate', type=float, default=0,
+                            help='Upper bound on rows written per second (0 = unlimited)')
+        parser.add_argument('--force', action='store_true', help='reencode: re-encode rows already in the current format')
+        parser.add_argument('--limit', type=int, default=0, help='Stop after this many rows (0 = all)')
+        parser.add_argument('--dry-run', action='store_true', help='Only count candidate rows after the checkpoint')
+
+    def load_checkpoint(self, options):
+        path = options['checkpoint']
+        if options['restart'] or not os.path.exists(path):
+            return {'mode': options['mode'], 'last_id': 0, 'written': 0, 'current': 0, 'failed': 0}
+        with open(path) as f:
+            state = json.load(f)
+        if state.get('mode') != options['mode']:
+            raise CommandError(f"Checkpoint {path} is for mode {state.get('mode')!r}; use --restart or another --checkpoint")
+        return state
+
+    def save_checkpoint(self, path, state):
+        # Write-then-rename so a crash never leaves a half-written checkpoint
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    def handle(self, *args, **options):
+        mode = options['mode']
+        batch_size = options['batch_size']
+        state = self.load_checkpoint(options)
+        candidates = MODES[mode]()
+
+        if options['dry_run']:
+            remaining = candidates.filter(id__gt=state['last_id']).count()
+            self.stdout.write(f"{remaining} {mode} messages after id {state['last_id']}")
+            return
+        if state['last_id']:
+            self.stdout.write(f"Resuming after id {state['last_id']}")
+
+        processes = max(1, options['processes'])
+        limit = options['limit']
+        started = time.monotonic()
+        processed = 0
+        read_id = state['last_id']
+        in_flight = deque()  # (rows by id, [futures]) in id order
+
+        # spawn, not fork, to match the web process's encryption pool
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+            while True:
+                # Keep one batch encoding while the previous one is written
+                while len(in_flight) < 2 and not (limit and processed + self.queued(in_flight) >= limit):
+                    batch = list(candidates.filter(id__gt=read_id).order_by('id')
+                                 .only('id', 'content', 'payload', 'sender_hash', 'receiver_hash')[:batch_size])
+                    if limit:
+                        batch = batch[:limit - processed - self.queued(in_flight)]
+                    if not batch:
+                        break
+                    read_id = batch[-1].id
+                    in_flight.append(self.submit(executor, batch, mode, processes, options['force']))
+                if not in_flight:
+                    break
+
+                rows, futures = in_flight.popleft()
+                results = [result for future in futures for result in future.result()]
+                self.write_results(rows, results, state)
+                state['last_id'] = max(rows)
+                self.save_checkpoint(options['checkpoint'], state)
+                processed += len(rows)
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"Up to id {state['last_id']}: {state['written']} written, {state['current']} already current, "
+                                  f"{state['failed']} failed ({processed / elapsed:.1f} rows/s)")
+                self.throttle(processed, started, options)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{mode} complete: {state['written']} written, {state['current']} already current, {state['failed']} failed"))
+
+    def queued(self, in_flight):
+        return sum(len(rows) for rows, _ in in_flight)
+
+    def submit(self, executor, batch, mode, processes, force):
+        """Split a batch across the pool; returns ({id: row}, futures in order)"""
+        items = []
+        for m in batch:
+            if mode == 'unencrypted':
+                items.append((m.id, m.content, None, m.sender_hash, m.receiver_hash))
+            else:
+                try:
+                    stored = m.encrypted_bytes()
+                except ValueError:
+                    stored = b''  # undecodable legacy content; reported as a failure by the worker
+                items.append((m.id, None, stored, m.sender_hash, m.receiver_hash))
+        chunk = -(-len(items) // processes)
+        futures = [executor.submit(reencode_batch, items[i:i + chunk], force) for i in range(0, len(items), chunk)]
+        return {m.id: m for m in batch}, futures
+
+    def write_results(self, rows, results, state):
+        updated = []
+        for message_id, encoded, error in results:
+            row = rows[message_id]
+            if error:
+                state['failed'] += 1
+                self.stderr.write(f'Message {message_id}: {error}')
+                continue
+            if encoded is None:
+                state['current'] += 1
+                if row.payload is not None:
+                    continue
+                # Current format but still base64 in content: only move it to the binary column
+                encoded = row.encrypted_bytes()
+            row.content = ''
+            row.payload = encoded
+            row.is_encrypted = True
+            updated.append(row)
+
+        for attempt in range(LOCK_RETRIES):
+            try:
+                with transaction.atomic():
+                    Message.objects.bulk_update(updated, ['content', 'payload', 'is_encrypted'])
+                break
+            except OperationalError:
+                # SQLite "database is locked": back off and let live writes through
+                if attempt == LOCK_RETRIES - 1:
+                    raise
+                time.sleep(0.5 * 2 ** attempt)
+        state['written'] += len(updated)
+
+    def throttle(self, written, started, options):
+        if options['pause']:
+            time.sleep(options['pause'])
+        if options['max_rate']:
+            ahead = written / options['max_rate'] - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
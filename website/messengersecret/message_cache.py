@@ -0,0 +1,97 @@
+"""Process-local LRU cache of decoded message plaintext.
+
+Decoding an encrypted message means a full PNG decode plus an LSB scan, so
+chat_view keeps the result keyed by message id and a digest of the stored
+content. A digest mismatch (the row was re-encrypted) counts as a miss.
+The cache is bounded both by entry count and by plaintext bytes.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import metrics
+
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+
+
+def content_digest(content) -> str:
+    """Short digest of a stored message body (str or bytes)"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+class DecodedMessageCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # message_id -> (digest, plaintext, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, message_id, digest):
+        """Cached plaintext for this message/content, or None"""
+        with self._lock:
+            entry = self._entries.get(message_id)
+            if entry is None or entry[0] != digest:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(message_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, message_id, digest, plaintext):
+        size = len(plaintext.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(message_id)
+            self._entries[message_id] = (digest, plaintext, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, message_id):
+        with self._lock:
+            self._discard(message_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _discard(self, message_id):
+        entry = self._entries.pop(message_id, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+decoded_cache = DecodedMessageCache(
+    max_entries=getattr(settings, 'DECODED_MESSAGE_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES),
+    max_bytes=getattr(settings, 'DECODED_MESSAGE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES),
+)
+
+for _stat in ('entries', 'bytes', 'hits', 'misses', 'evictions'):
+    metrics.register_gauge(f'decoded_cache_{_stat}', lambda stat=_stat: decoded_cache.stats()[stat])
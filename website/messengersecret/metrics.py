@@ -0,0 +1,214 @@
+"""Lightweight timing spans and counters for the chat hot path.
+
+Enabled with the METRICS_ENABLED environment variable (read at import, so
+encryption worker processes inherit the setting). When disabled, span()
+returns a shared no-op context manager and incr()/observe() return after
+one flag check, so instrumented code pays almost nothing.
+
+Work done in encryption worker processes is recorded into a local
+registry with collect() and merged into the web process by the writer
+thread. render() produces Prometheus text exposition format for the
+metrics endpoint.
+"""
+import contextlib
+import os
+import threading
+import time
+
+enabled = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes', 'on')
+
+PREFIX = 'messenger_'
+# Upper bounds in seconds; spans run from sub-millisecond embeds to PNG encodes
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class Registry:
+    """Counters and timing histograms, safe to update from any thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.timers = {}  # name -> [count, total seconds, per-bucket counts]
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = [0, 0.0, [0] * len(BUCKETS)]
+            timer[0] += 1
+            timer[1] += seconds
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    timer[2][i] += 1
+                    break
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'timers': {name: [t[0], t[1], list(t[2])] for name, t in self.timers.items()},
+            }
+
+    def merge(self, snapshot):
+        """Add another registry's snapshot (e.g. from a worker process) into this one"""
+        with self._lock:
+            for name, value in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, (count, total, buckets) in snapshot['timers'].items():
+                timer = self.timers.setdefault(name, [0, 0.0, [0] * len(BUCKETS)])
+                timer[0] += count
+                timer[1] += total
+                timer[2] = [a + b for a, b in zip(timer[2], buckets)]
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.timers.clear()
+
+
+registry = Registry()
+_gauges = {}  # name -> zero-argument callable, sampled at render time
+_local = threading.local()
+
+
+def _current():
+    return getattr(_local, 'registry', None) or registry
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current().observe(self.name, time.perf_counter() - self.start)
+        if exc_type is not None:
+            _current().incr(f'{self.name}_errors')
+        return False
+
+
+def span(name):
+    """Time a block: ``with metrics.span('stego_embed'): ...``"""
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def incr(name, amount=1):
+    if enabled:
+        _current().incr(name, amount)
+
+
+def observe(name, seconds):
+    if enabled:
+        _current().observe(name, seconds)
+
+
+def register_gauge(name, fn):
+    """Report fn() as a gauge on every render (queue depth, cache sizes, ...)"""
+    _gauges[name] = fn
+
+
+@contextlib.contextmanager
+def collect():
+    """Record this thread's metrics into a fresh registry and yield it.
+
+    Used around encryption jobs so their spans can be shipped back to the
+    web process instead of being lost in a worker process.
+    """
+    local = Registry()
+    previous = getattr(_local, 'registry', None)
+    _local.registry = local
+    try:
+        yield local
+    finally:
+        _local.registry = previous
+
+
+def db_query_wrapper(execute, sql, params, many, context):
+    """connection.execute_wrapper() hook timing every database query"""
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        observe('db_query', time.perf_counter() - start)
+
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format"""
+    snapshot = registry.snapshot()
+    lines = []
+    for name, value in sorted(snapshot['counters'].items()):
+        lines.append(f'# TYPE {PREFIX}{name}_total counter')
+        lines.append(f'{PREFIX}{name}_total {_format(value)}')
+    for name, fn in sorted(_gauges.items()):
+        try:
+            value = fn()
+        except Exception:
+            continue
+        lines.append(f'# TYPE {PREFIX}{name} gauge')
+        lines.append(f'{PREFIX}{name} {_format(value)}')
+    for name, (count, total, buckets) in sorted(snapshot['timers'].items()):
+        metric = f'{PREFIX}{name}_seconds'
+        lines.append(f'# TYPE {metric} histogram')
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS, buckets):
+            cumulative += bucket
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{le="+Inf"}} {count}')
+        lines.append(f'{metric}_sum {total!r}')
+        lines.append(f'{metric}_count {count}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """Times each request and the database queries it runs.
+
+    Listed in MIDDLEWARE unconditionally; when metrics are disabled Django
+    drops it at startup (MiddlewareNotUsed), so it costs nothing per request.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+        from django.core.exceptions import MiddlewareNotUsed
+        if not enabled:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self._acall(request)
+        from django.db import connection
+        with span('http_request'), connection.execute_wrapper(db_query_wrapper):
+            response = self.get_response(request)
+        incr(f'http_responses_{response.status_code // 100}xx')
+        return response
+
+    async def _acall(self, request):
+        # Queries of async views run in sync_to_async threads; only the
+        # request itself is timed here (streams are timed until headers)
+        with span('http_request'):
+            response = await self.get_response(request)
+        incr(f'http_responses_{response.status_code // 100}xx')
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messengersecret', '0004_message_is_encrypted'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='payload',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:46
+
+from django.db import migrations, models
+
+
+def mark_existing_plain_text_bypassed(apps, schema_editor):
+    """Keep historical plain-text rows plain.
+
+    Before this field, a message sent with encryption bypassed was stored
+    as is_encrypted=False, and so was one whose background encryption never
+    ran. The two cannot be told apart, so every existing unencrypted row is
+    treated as a deliberate choice. Otherwise the startup sweep and
+    `reencrypt_messages unencrypted` would encrypt them all. The cost is
+    that a row whose encryption was lost before the upgrade stays plain.
+    Clearing its encryption_bypassed flag makes the sweep pick it up.
+    """
+    Message = apps.get_model('messengersecret', 'Message')
+    Message.objects.filter(is_encrypted=False).update(encryption_bypassed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messengersecret', '0005_message_payload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='encryption_bypassed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_existing_plain_text_bypassed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:48
+
+from django.db import migrations, models
+
+
+def backfill_conversation_key(apps, schema_editor):
+    """Set conversation_key with one UPDATE per distinct (sender, receiver) pair"""
+    Message = apps.get_model('messengersecret', 'Message')
+    pairs = (Message.objects.exclude(receiver__isnull=True).exclude(receiver='')
+             .values_list('sender', 'receiver').distinct())
+    for sender, receiver in pairs.iterator():
+        first, second = sorted((sender, receiver))
+        Message.objects.filter(sender=sender, receiver=receiver).update(conversation_key=f"{first}:{second}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messengersecret', '0006_message_encryption_bypassed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='conversation_key',
+            field=models.CharField(blank=True, max_length=201, null=True),
+        ),
+        # Backfill before building the indexes so they are written once
+        migrations.RunPython(backfill_conversation_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation_key', 'timestamp', 'id'], name='message_conv_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'receiver'], name='message_sender_receiver_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['receiver', 'sender'], name='message_receiver_sender_idx'),
+        ),
+    ]
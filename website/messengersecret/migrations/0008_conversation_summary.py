@@ -0,0 +1,64 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_summaries(apps, schema_editor):
+    """One summary per existing Contact row or message pair, pointing at the latest message"""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Contact = apps.get_model('messengersecret', 'Contact')
+    Message = apps.get_model('messengersecret', 'Message')
+    ConversationSummary = apps.get_model('messengersecret', 'ConversationSummary')
+
+    usernames = dict(User.objects.values_list('id', 'username'))
+    user_ids = {username: user_id for user_id, username in usernames.items()}
+
+    pairs = set(Contact.objects.values_list('user_id', 'contact_id'))
+    message_pairs = (Message.objects.exclude(receiver__isnull=True).exclude(receiver='')
+                     .values_list('sender', 'receiver').distinct())
+    for sender, receiver in message_pairs.iterator():
+        if sender in user_ids and receiver in user_ids and sender != receiver:
+            pairs.add((user_ids[sender], user_ids[receiver]))
+            pairs.add((user_ids[receiver], user_ids[sender]))
+
+    summaries = []
+    for user_id, contact_id in pairs:
+        first, second = sorted((usernames[user_id], usernames[contact_id]))
+        last = (Message.objects.filter(conversation_key=f"{first}:{second}")
+                .order_by('-timestamp', '-id').only('id', 'timestamp').first())
+        summaries.append(ConversationSummary(
+            user_id=user_id,
+            contact_id=contact_id,
+            last_message=last,
+            last_message_at=last.timestamp if last else None,
+        ))
+    ConversationSummary.objects.bulk_create(summaries, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messengersecret', '0007_message_conversation_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('contact', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='messengersecret.message')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-last_message_at'], name='summary_user_recent_idx')],
+                'unique_together': {('user', 'contact')},
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
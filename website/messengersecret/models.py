@@ -1,5 +1,7 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
+import base64
 import hashlib
 import os
 
@@ -7,11 +9,15 @@ class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     user_hash = models.CharField(max_length=64, unique=True)  # SHA256 hash
 
+    @staticmethod
+    def make_user_hash(username):
+        # Generate hash using username + secret salt
+        secret_salt = os.environ.get('SECRET_KEY', 'default_salt')
+        return hashlib.sha256(f"{username}:{secret_salt}".encode()).hexdigest()
+
     def save(self, *args, **kwargs):
         if not self.user_hash:
-            # Generate hash using username + secret salt
-            secret_salt = os.environ.get('SECRET_KEY', 'default_salt')
-            self.user_hash = hashlib.sha256(f"{self.user.username}:{secret_salt}".encode()).hexdigest()
+            self.user_hash = self.make_user_hash(self.user.username)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -23,12 +29,45 @@ class Message(models.Model):
     sender_hash = models.CharField(max_length=64, null=True, blank=True)
     receiver_hash = models.CharField(max_length=64, null=True, blank=True)
     content = models.TextField()
+    payload = models.BinaryField(null=True, blank=True)  # Raw encrypted bytes; replaces base64 in content
     is_encrypted = models.BooleanField(default=True)  # Track if message is encrypted
+    encryption_bypassed = models.BooleanField(default=False)  # Sender chose plain text; never re-enqueue
     timestamp = models.DateTimeField(auto_now_add=True)
+    # "<username>:<username>" in sorted order, shared by both directions of a P2P chat
+    conversation_key = models.CharField(max_length=201, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation_key', 'timestamp', 'id'], name='message_conv_ts_id_idx'),
+            # Cover the contact fallback, which reads usernames by either side
+            models.Index(fields=['sender', 'receiver'], name='message_sender_receiver_idx'),
+            models.Index(fields=['receiver', 'sender'], name='message_receiver_sender_idx'),
+        ]
+
+    @staticmethod
+    def make_conversation_key(username, other_username) -> str:
+        """Direction-independent key for the conversation between two users"""
+        first, second = sorted((username, other_username))
+        return f"{first}:{second}"
+
+    def save(self, *args, **kwargs):
+        if not self.conversation_key and self.receiver:
+            self.conversation_key = self.make_conversation_key(self.sender, self.receiver)
+        super().save(*args, **kwargs)
+
+    def encrypted_bytes(self) -> bytes:
+        """Stored ciphertext, from the binary column or the legacy base64 content"""
+        if self.payload is not None:
+            return bytes(self.payload)
+        return base64.b64decode(self.content.encode('ascii'))
+
+    def stored_body(self):
+        """Whatever column currently holds this message's body (for cache digests)"""
+        return self.payload if self.payload is not None else self.content
 
     def __str__(self):
         recipient = f" -> {self.receiver}" if self.receiver else " (room)"
-r        return f"{self.sender}{recipient}: {self.content[:50]}"
+        return f"{self.sender}{recipient}: {self.content[:50]}"
 
 
 class Contact(models.Model):
@@ -46,3 +85,47 @@ class Contact(models.Model):
 
     def __str__(self):
         return f"{self.user.username} -> {self.contact.username}"
+
+
+class ConversationSummary(models.Model):
+    """Denormalized per-(user, contact) conversation state.
+
+    Updated in the same transaction as every send, so the contact list is a
+    single indexed query and never has to scan Message rows.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_summaries')
+    contact = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    last_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('user', 'contact'),)
+        indexes = [
+            models.Index(fields=['user', '-last_message_at'], name='summary_user_recent_idx'),
+        ]
+
+    @classmethod
+    def ensure_pair(cls, user, contact):
+        """Make sure both directions have a summary row"""
+        cls.objects.get_or_create(user=user, contact=contact)
+        cls.objects.get_or_create(user=contact, contact=user)
+
+    @classmethod
+    def record_message(cls, message, sender, receiver):
+        """Point both sides at a new message and bump the receiver's unread count"""
+        with transaction.atomic():
+            cls.ensure_pair(sender, receiver)
+            cls.objects.filter(user=sender, contact=receiver).update(
+                last_message=message, last_message_at=message.timestamp)
+            cls.objects.filter(user=receiver, contact=sender).update(
+                last_message=message, last_message_at=message.timestamp,
+                unread_count=F('unread_count') + 1)
+
+    @classmethod
+    def mark_read(cls, user, contact):
+        # Filter on unread_count so opening an already-read chat is not a write
+        cls.objects.filter(user=user, contact=contact, unread_count__gt=0).update(unread_count=0)
+
+    def __str__(self):
+        return f"{self.user.username} -> {self.contact.username} ({self.unread_count} unread)"
@@ -0,0 +1,75 @@
+"""Compression stage for message payloads, applied before framing and embedding.
+
+Every payload bit costs a carrier LSB, so a smaller payload means a smaller
+carrier size class, fewer pixels touched and a faster PNG encode. choose()
+picks the smallest of the enabled codecs, using cheap size heuristics to
+avoid running coders that cannot win:
+
+- under MIN_COMPRESS_BYTES the frame and codec overheads outweigh any gain,
+  so short chat lines stay raw;
+- RLE is only tried when the text actually has runs;
+- the range coder carries a 1 KB frequency table, so it is only run when
+  its entropy estimate beats the best result so far.
+
+The chosen codec id is recorded in the frame header (see frame.py).
+"""
+import zlib
+
+import numpy as np
+
+from . import frame, rangecoder, rle
+
+MIN_COMPRESS_BYTES = 32
+# Try RLE only if there are at most this many runs per byte
+RLE_MAX_RUN_DENSITY = 0.75
+
+DEFAULT_CODECS = (frame.CODEC_ZLIB, frame.CODEC_RLE, frame.CODEC_RANGE)
+
+
+def _deflate(data: bytes) -> bytes:
+    # Raw deflate (negative wbits): the frame already has length and CRC
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _inflate(data: bytes) -> bytes:
+    return zlib.decompress(data, -15)
+
+
+def _run_density(data: bytes) -> float:
+    values = np.frombuffer(data, dtype=np.uint8)
+    return (np.count_nonzero(values[1:] != values[:-1]) + 1) / values.size
+
+
+def choose(data: bytes, codecs=DEFAULT_CODECS):
+    """(codec id, encoded bytes) giving the smallest payload; CODEC_RAW if nothing helps"""
+    best_codec, best = frame.CODEC_RAW, data
+    if len(data) < MIN_COMPRESS_BYTES or not codecs:
+        return best_codec, best
+
+    if frame.CODEC_ZLIB in codecs:
+        deflated = _deflate(data)
+        if len(deflated) < len(best):
+            best_codec, best = frame.CODEC_ZLIB, deflated
+    if frame.CODEC_RLE in codecs and _run_density(data) <= RLE_MAX_RUN_DENSITY:
+        packed = rle.encode_bytes(data)
+        if len(packed) < len(best):
+            best_codec, best = frame.CODEC_RLE, packed
+    if frame.CODEC_RANGE in codecs and rangecoder.estimate_compressed_size(data) < len(best):
+        coded = rangecoder.compress(data)
+        if len(coded) < len(best):
+            best_codec, best = frame.CODEC_RANGE, coded
+    return best_codec, best
+
+
+def decode(codec: int, data: bytes) -> bytes:
+    """Undo choose() for a payload stored with the given codec id"""
+    if codec == frame.CODEC_RAW:
+        return data
+    if codec == frame.CODEC_ZLIB:
+        return _inflate(data)
+    if codec == frame.CODEC_RLE:
+        return rle.decode_bytes(data)
+    if codec == frame.CODEC_RANGE:
+        return rangecoder.decompress(data)
+    raise ValueError(f"Unknown payload codec {codec}")
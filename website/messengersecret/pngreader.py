@@ -0,0 +1,152 @@
+"""Incremental PNG row reader.
+
+Payload bits live in the first rows of a carrier, so decoding a message
+only needs those rows. ``PngRowReader`` inflates the IDAT stream just far
+enough to unfilter the requested rows, instead of having PIL decode the
+whole image. Only the layouts this app writes are read row by row (8-bit
+gray/RGB/RGBA, not interlaced); anything else, or a request for most of
+the image, falls back to a full PIL decode.
+"""
+import io
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from .bitplane import extract_bytes
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+CHANNELS = {0: 1, 2: 3, 4: 2, 6: 4}  # colour type -> samples per pixel
+COLOUR_TYPES = {channels: colour_type for colour_type, channels in CHANNELS.items()}
+FULL_DECODE_FRACTION = 0.5  # past this share of rows, PIL's C decoder is faster
+
+
+def _chunk(chunk_type: bytes, body: bytes) -> bytes:
+    return struct.pack('>I', len(body)) + chunk_type + body + struct.pack('>I', zlib.crc32(chunk_type + body))
+
+
+def unfilter_rows(lines, prior: np.ndarray, bpp: int) -> list:
+    """Reverse a run of filtered scanlines (filter byte + data) with PIL's C unfilter.
+
+    Average (3) and Paeth (4) depend on the previous output byte, so they
+    cannot be undone with whole-row NumPy operations. The lines are wrapped
+    in a small PNG whose first row is `prior` stored unfiltered, which
+    gives the real lines the right previous row, and decoded by PIL. The
+    wrapper uses stored (level 0) deflate, so it costs a copy, not a
+    compression pass.
+    """
+    width = len(prior) // bpp
+    seed = b'\x00' + prior.tobytes()
+    header = struct.pack('>IIBBBBB', width, len(lines) + 1, 8, COLOUR_TYPES[bpp], 0, 0, 0)
+    png = (PNG_SIGNATURE + _chunk(b'IHDR', header)
+           + _chunk(b'IDAT', zlib.compress(seed + b''.join(lines), 0)) + _chunk(b'IEND', b''))
+    with Image.open(io.BytesIO(png)) as image:
+        pixels = np.asarray(image).reshape(len(lines) + 1, -1)
+    return list(pixels[1:])
+
+
+def unfilter_row(filter_type: int, raw: np.ndarray, prior: np.ndarray, bpp: int) -> np.ndarray:
+    """Reverse one PNG scanline filter (uint8 arithmetic wraps mod 256)"""
+    if filter_type == 0:
+        return raw
+    if filter_type == 1:
+        return np.cumsum(raw.reshape(-1, bpp), axis=0, dtype=np.uint8).reshape(-1)
+    if filter_type == 2:
+        return raw + prior
+    if filter_type in (3, 4):
+        return unfilter_rows([bytes((filter_type,)) + raw.tobytes()], prior, bpp)[0]
+    raise ValueError(f"Invalid PNG filter type {filter_type}")
+
+
+class PngRowReader:
+    """Decode a PNG's rows top to bottom, only as far as asked"""
+
+    def __init__(self, data: bytes):
+        if not data.startswith(PNG_SIGNATURE):
+            raise ValueError("Not a PNG image")
+        self.data = data
+        self._idat = []
+        header = None
+        pos = len(PNG_SIGNATURE)
+        while pos + 8 <= len(data):
+            length, chunk_type = struct.unpack_from('>I4s', data, pos)
+            body = pos + 8
+            if chunk_type == b'IHDR':
+                header = struct.unpack_from('>IIBBBBB', data, body)
+            elif chunk_type == b'IDAT':
+                self._idat.append(memoryview(data)[body:body + length])
+            elif chunk_type == b'IEND':
+                break
+            pos = body + length + 4  # skip CRC
+        if header is None:
+            raise ValueError("PNG has no IHDR chunk")
+
+        self.width, self.height, bit_depth, colour_type, _, _, interlace = header
+        self.channels = CHANNELS.get(colour_type)
+        # Row-by-row decoding only for the layouts we write ourselves
+        self.incremental = bit_depth == 8 and self.channels is not None and interlace == 0
+        self.stride = self.width * (self.channels or 0)
+
+        self._rows = []
+        self._inflater = zlib.decompressobj()
+        self._chunk = 0
+        self._pending = b''
+        self._full = None
+
+    @property
+    def rows_read(self) -> int:
+        return self.height if self._full is not None else len(self._rows)
+
+    def _inflate(self, size):
+        """Next `size` bytes of the decompressed image stream"""
+        while len(self._pending) < size:
+            if self._inflater.unconsumed_tail:
+                chunk = self._inflater.unconsumed_tail
+            elif self._chunk < len(self._idat):
+                chunk = self._idat[self._chunk]
+                self._chunk += 1
+            else:
+                raise ValueError("PNG image data ends early")
+            self._pending += self._inflater.decompress(chunk, size - len(self._pending))
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def read_all(self) -> np.ndarray:
+        """Whole image as PIL would return it"""
+        if self._full is None:
+            with Image.open(io.BytesIO(self.data)) as image:
+                self._full = np.asarray(image)
+            self._rows = []
+        return self._full
+
+    def read_rows(self, count: int) -> np.ndarray:
+        """First `count` rows as a (rows, width[, channels]) array"""
+        count = min(count, self.height)
+        if (self._full is not None or not self.incremental
+                or count > self.height * FULL_DECODE_FRACTION):
+            return self.read_all()[:count]
+
+        bpp = self.channels
+        prior = self._rows[-1] if self._rows else np.zeros(self.stride, dtype=np.uint8)
+        line_size = self.stride + 1
+        block = self._inflate(line_size * (count - len(self._rows)))
+        lines = [block[i:i + line_size] for i in range(0, len(block), line_size)]
+        if any(line[0] in (3, 4) for line in lines):
+            # One C-speed pass for the whole run instead of a per-byte loop
+            self._rows.extend(unfilter_rows(lines, prior, bpp))
+        else:
+            for line in lines:
+                raw = np.frombuffer(line, dtype=np.uint8, offset=1)
+                prior = unfilter_row(line[0], raw, prior, bpp)
+                self._rows.append(prior)
+        shape = (count, self.width, bpp) if bpp > 1 else (count, self.width)
+        return np.stack(self._rows[:count]).reshape(shape)
+
+    def read_lsb_bytes(self, n_bytes: int) -> bytes:
+        """Read n_bytes of LSB payload, decoding only the rows that hold them"""
+        per_row = self.width * (self.channels or 1)
+        rows = -(-(n_bytes * 8) // per_row)
+        if rows > self.height:
+            raise ValueError("Image too small for requested payload")
+        return extract_bytes(self.read_rows(rows).reshape(-1), n_bytes)
@@ -0,0 +1,126 @@
+"""Publish/subscribe hub for real-time conversation events.
+
+Publishers are ordinary sync code (views, the encryption writer thread);
+subscribers are async consumers such as the SSE view served over ASGI.
+``InProcessHub`` fans events out inside one process. A broker-backed hub
+(Redis, Postgres LISTEN/NOTIFY, ...) only has to implement ``publish`` and
+``subscribe`` and be named in ``settings.PUBSUB_HUB``.
+"""
+import asyncio
+import logging
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 100
+
+
+def conversation_channel(conversation_key) -> str:
+    return f"conversation:{conversation_key}"
+
+
+class Subscription:
+    """Async stream of events for one subscriber; close() when done"""
+
+    def __init__(self, hub, channel, max_queue=DEFAULT_QUEUE_SIZE):
+        self.hub = hub
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def deliver(self, event):
+        """Called on the subscriber's event loop"""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow consumer: drop the event and tell it to resync from the DB
+            self.overflowed = True
+
+    async def get(self):
+        if self.overflowed:
+            self.overflowed = False
+            return {'type': 'resync'}
+        return await self.queue.get()
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class PubSubHub:
+    """Interface for hubs"""
+
+    def publish(self, channel, event):
+        raise NotImplementedError
+
+    def subscribe(self, channel) -> Subscription:
+        """Must be called from a running event loop"""
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class InProcessHub(PubSubHub):
+    """Fan-out to subscribers in this process; safe to publish from any thread"""
+
+    def __init__(self, max_queue=DEFAULT_QUEUE_SIZE):
+        self.max_queue = max_queue
+        self._subscribers = {}  # channel -> set of Subscription
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # Subscriber's loop already closed
+                self.unsubscribe(subscription)
+
+    def subscribe(self, channel) -> Subscription:
+        subscription = Subscription(self, channel, self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_hub() -> PubSubHub:
+    """Process-wide hub built from settings.PUBSUB_HUB"""
+    global _hub
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                hub_class = import_string(getattr(settings, 'PUBSUB_HUB', 'messengersecret.pubsub.InProcessHub'))
+                _hub = hub_class()
+    return _hub
+
+
+def publish_conversation_event(conversation_key, event):
+    """Publish without ever failing the caller (sends must not break on push errors)"""
+    if not conversation_key:
+        return
+    try:
+        get_hub().publish(conversation_channel(conversation_key), event)
+    except Exception:
+        logger.exception("Failed to publish %s event", event.get('type'))
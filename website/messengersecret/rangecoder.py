@@ -0,0 +1,218 @@
+"""In-process range coder, stream-compatible with test/rangenc.cpp.
+
+Stream layout (all fields range-coded, bits written MSB first):
+
+    4 bytes   input length, little endian, uniform model
+    1024 B    256 x uint32 symbol frequencies, little endian, uniform model
+    ...       input bytes, coded with the frequency table above
+
+Frequencies are byte counts plus one, so every symbol stays codable. The
+frequency model is built with NumPy; the coding loop itself is sequential
+by nature and keeps its state in plain ints.
+
+The length field is untrusted: the decoder refuses streams shorter than
+the header, declared lengths above MAX_DECODED_BYTES (or the caller's
+max_length), and streams that run out of bits long before the declared
+length, so arbitrary bytes fail fast instead of decoding for minutes.
+"""
+from bisect import bisect_right
+
+import numpy as np
+
+TOP = 0xFFFFFFFF
+HALF = 0x80000000
+QUARTER = 0x40000000
+THREE_QUARTERS = 0xC0000000
+
+HEADER_BYTES = 4 + 256 * 4
+UNIFORM_CUM = list(range(257))
+# Hard cap on the declared length; far above any stored carrier or message
+MAX_DECODED_BYTES = 64 * 1024 * 1024
+# Zero bits a decoder may read past the end of input (the initial 32-bit fill
+# plus the encoder's final flush); more means the stream is truncated or not ours
+MAX_OVERRUN_BITS = 64
+
+
+def count_frequencies(data) -> np.ndarray:
+    """Byte histogram plus one, as rangenc.cpp's count_frequencies"""
+    symbols = np.frombuffer(data, dtype=np.uint8)
+    return np.bincount(symbols, minlength=256).astype(np.uint64) + 1
+
+
+def cumulative(freqs) -> list:
+    """Cumulative table with a leading zero, as a plain list for fast indexing"""
+    return [0] + np.cumsum(freqs, dtype=np.uint64).tolist()
+
+
+def estimate_compressed_size(data) -> int:
+    """Order-0 entropy estimate of compress(data) in bytes, header included"""
+    if len(data) == 0:
+        return HEADER_BYTES
+    freqs = count_frequencies(data).astype(np.float64)
+    counts = freqs - 1
+    bits = float(np.sum(counts * np.log2(freqs.sum() / freqs)))
+    return HEADER_BYTES + int(bits / 8) + 1
+
+
+class RangeEncoder:
+    """Streaming encoder: feed bytes with write(), then call finish()"""
+
+    def __init__(self, length: int, freqs):
+        self.length = length
+        self.written = 0
+        self.freqs = [int(f) for f in freqs]
+        self.cum = cumulative(self.freqs)
+        self.total = self.cum[-1]
+        self.low = 0
+        self.high = TOP
+        self.pending = 0
+        self._bits = []
+
+        header = bytearray(length.to_bytes(4, 'little'))
+        for freq in self.freqs:
+            header += freq.to_bytes(4, 'little')
+        self._encode(header, UNIFORM_CUM, 256)
+
+    def _encode(self, data, cum, total):
+        low, high, pending = self.low, self.high, self.pending
+        bits = self._bits
+        emit = bits.append
+        for symbol in data:
+            span = high - low + 1
+            high = low + span * cum[symbol + 1] // total - 1
+            low = low + span * cum[symbol] // total
+            while True:
+                if high < HALF:
+                    emit(0)
+                    if pending:
+                        bits.extend([1] * pending)
+                        pending = 0
+                elif low >= HALF:
+                    emit(1)
+                    if pending:
+                        bits.extend([0] * pending)
+                        pending = 0
+                    low -= HALF
+                    high -= HALF
+                elif low >= QUARTER and high < THREE_QUARTERS:
+                    pending += 1
+                    low -= QUARTER
+                    high -= QUARTER
+                else:
+                    break
+                low <<= 1
+                high = (high << 1) | 1
+        self.low, self.high, self.pending = low, high, pending
+
+    def write(self, data) -> None:
+        """Encode a chunk of bytes, bytearray or memoryview"""
+        chunk = memoryview(data).cast('B')
+        if self.written + len(chunk) > self.length:
+            raise ValueError("More data written than the declared length")
+        self._encode(chunk, self.cum, self.total)
+        self.written += len(chunk)
+
+    def finish(self) -> bytes:
+        """Flush the final interval and return the complete stream"""
+        if self.written != self.length:
+            raise ValueError(f"Declared {self.length} bytes but wrote {self.written}")
+        pending = self.pending + 1
+        if self.low < QUARTER:
+            self._bits.append(0)
+            self._bits.extend([1] * pending)
+        else:
+            self._bits.append(1)
+            self._bits.extend([0] * pending)
+        self.pending = 0
+        return np.packbits(np.array(self._bits, dtype=np.uint8)).tobytes()
+
+
+class RangeDecoder:
+    """Streaming decoder: read() returns the next decoded bytes on demand"""
+
+    def __init__(self, data, max_length: int = None):
+        # The header alone is coded at 8 bits per byte in the uniform model
+        if len(data) < HEADER_BYTES:
+            raise ValueError(f"Range-coded stream too short: {len(data)} bytes")
+        self._bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8)).tolist()
+        self._pos = 0
+        self.low = 0
+        self.high = TOP
+        self.code = 0
+        for _ in range(32):
+            self.code = (self.code << 1) | self._next_bit()
+
+        header = self._decode(HEADER_BYTES, UNIFORM_CUM)
+        self.length = int.from_bytes(header[:4], 'little')
+        limit = MAX_DECODED_BYTES if max_length is None else min(max_length, MAX_DECODED_BYTES)
+        if self.length > limit:
+            raise ValueError(f"Range-coded stream declares {self.length} bytes, limit is {limit}")
+        freqs = np.frombuffer(bytes(header[4:]), dtype='<u4')
+        self.cum = cumulative(freqs)
+        self.remaining = self.length
+
+    def _next_bit(self) -> int:
+        # Past the end of input the C++ decoder reads zeros
+        bit = self._bits[self._pos] if self._pos < len(self._bits) else 0
+        self._pos += 1
+        return bit
+
+    def _decode(self, count, cum) -> bytearray:
+        low, high, code, pos = self.low, self.high, self.code, self._pos
+        bits = self._bits
+        n_bits = len(bits)
+        total = cum[-1]
+        out = bytearray(count)
+        for i in range(count):
+            span = high - low + 1
+            value = ((code - low + 1) * total - 1) // span
+            symbol = bisect_right(cum, value) - 1
+            out[i] = symbol
+            high = low + span * cum[symbol + 1] // total - 1
+            low = low + span * cum[symbol] // total
+            while True:
+                if high < HALF:
+                    pass
+                elif low >= HALF:
+                    low -= HALF
+                    high -= HALF
+                    code -= HALF
+                elif low >= QUARTER and high < THREE_QUARTERS:
+                    low -= QUARTER
+                    high -= QUARTER
+                    code -= QUARTER
+                else:
+                    break
+                low <<= 1
+                high = (high << 1) | 1
+                if pos < n_bits:
+                    code = (code << 1) | bits[pos]
+                else:
+                    if pos - n_bits >= MAX_OVERRUN_BITS:
+                        raise ValueError("Range-coded stream ends before its declared length")
+                    code <<= 1
+                pos += 1
+        self.low, self.high, self.code, self._pos = low, high, code, pos
+        return out
+
+    def read(self, n: int = -1) -> bytes:
+        """Decode up to n bytes (all remaining when n < 0)"""
+        if n < 0 or n > self.remaining:
+            n = self.remaining
+        out = self._decode(n, self.cum)
+        self.remaining -= n
+        return bytes(out)
+
+
+def compress(data) -> bytes:
+    """Range-code data into a rangenc.cpp-compatible stream"""
+    data = memoryview(data).cast('B')
+    encoder = RangeEncoder(len(data), count_frequencies(data))
+    encoder.write(data)
+    return encoder.finish()
+
+
+def decompress(data, max_length: int = None) -> bytes:
+    """Decode a complete rangenc.cpp-compatible stream; ValueError if it is malformed
+    or declares more than max_length (or MAX_DECODED_BYTES) bytes"""
+    return RangeDecoder(data, max_length).read()
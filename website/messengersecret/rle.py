@@ -0,0 +1,134 @@
+"""Run-length coding over bytes and bit-planes, vectorised with NumPy.
+
+Bytes use a PackBits-style token stream, so text with few repeats grows by
+at most one byte per 128:
+
+    0..127    literal: the next (n + 1) bytes are copied as-is
+    128..255  repeat: the next byte is repeated (n - 125) times (3..130)
+
+Bit-planes (0/1 arrays, e.g. a thresholded image) are coded as the first
+bit plus the lengths of alternating runs, stored at the narrowest unsigned
+width that fits the longest run.
+"""
+import struct
+
+import numpy as np
+from PIL import Image
+
+MAX_LITERAL = 128
+MIN_REPEAT = 3
+MAX_REPEAT = 130
+
+# Bit-run header: flags byte (bit 0 = first bit, bits 1-2 = width code), run count
+RUN_HEADER = struct.Struct('<BI')
+RUN_DTYPES = (np.dtype('<u1'), np.dtype('<u2'), np.dtype('<u4'))
+
+
+def _runs(values: np.ndarray):
+    """Start index and length of each run of equal values"""
+    if values.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    starts = np.concatenate(([0], np.flatnonzero(values[1:] != values[:-1]) + 1))
+    lengths = np.diff(np.append(starts, values.size))
+    return starts, lengths
+
+
+def encode_bytes(data: bytes) -> bytes:
+    """PackBits-style RLE of a byte string"""
+    values = np.frombuffer(bytes(data), dtype=np.uint8)
+    if values.size == 0:
+        return b''
+    starts, lengths = _runs(values)
+    repeat = lengths >= MIN_REPEAT
+
+    out = []
+    # Consecutive short runs form one literal span, so the Python loop below
+    # runs once per repeat run or literal span, not once per byte
+    group_starts = np.flatnonzero(np.concatenate(([True], repeat[1:] | repeat[:-1])))
+    for g, first in enumerate(group_starts):
+        last = group_starts[g + 1] if g + 1 < len(group_starts) else len(starts)
+        begin = int(starts[first])
+        if repeat[first]:
+            value = values[begin:begin + 1].tobytes()
+            remaining = int(lengths[first])
+            while remaining >= MIN_REPEAT:
+                n = min(remaining, MAX_REPEAT)
+                out.append(bytes((n + 125,)) + value)
+                remaining -= n
+            if remaining:
+                out.append(bytes((remaining - 1,)) + value * remaining)
+        else:
+            end = int(starts[last - 1] + lengths[last - 1])
+            for offset in range(begin, end, MAX_LITERAL):
+                chunk = values[offset:min(offset + MAX_LITERAL, end)].tobytes()
+                out.append(bytes((len(chunk) - 1,)) + chunk)
+    return b''.join(out)
+
+
+def decode_bytes(data: bytes) -> bytes:
+    """Inverse of encode_bytes"""
+    data = bytes(data)
+    out = []
+    pos = 0
+    while pos < len(data):
+        header = data[pos]
+        if header < MAX_LITERAL:
+            end = pos + 1 + header + 1
+            if end > len(data):
+                raise ValueError("Truncated RLE literal")
+            out.append(data[pos + 1:end])
+            pos = end
+        else:
+            if pos + 1 >= len(data):
+                raise ValueError("Truncated RLE repeat")
+            out.append(data[pos + 1:pos + 2] * (header - 125))
+            pos += 2
+    return b''.join(out)
+
+
+def encode_bits(bits: np.ndarray):
+    """(first bit, run lengths) for a 0/1 array"""
+    bits = np.asarray(bits, dtype=np.uint8).reshape(-1)
+    _, lengths = _runs(bits)
+    first = int(bits[0]) if bits.size else 0
+    return first, lengths
+
+
+def decode_bits(first: int, lengths) -> np.ndarray:
+    """0/1 uint8 array from encode_bits output"""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    values = (np.arange(lengths.size) + first) & 1
+    return np.repeat(values.astype(np.uint8), lengths)
+
+
+def pack_bit_runs(bits: np.ndarray) -> bytes:
+    """Serialize a bit-plane as header + run lengths at the narrowest width"""
+    first, lengths = encode_bits(bits)
+    longest = int(lengths.max()) if lengths.size else 0
+    code = 0 if longest < 1 << 8 else 1 if longest < 1 << 16 else 2
+    return RUN_HEADER.pack(first | (code << 1), lengths.size) + lengths.astype(RUN_DTYPES[code]).tobytes()
+
+
+def unpack_bit_runs(data: bytes) -> np.ndarray:
+    """Inverse of pack_bit_runs"""
+    flags, count = RUN_HEADER.unpack_from(data)
+    code = flags >> 1
+    if code >= len(RUN_DTYPES):
+        raise ValueError("Invalid bit-run width")
+    dtype = RUN_DTYPES[code]
+    body = data[RUN_HEADER.size:]
+    if len(body) != count * dtype.itemsize:
+        raise ValueError("Truncated bit-run data")
+    return decode_bits(flags & 1, np.frombuffer(body, dtype=dtype))
+
+
+def image_to_bitstream(image, threshold=128, packed=True) -> np.ndarray:
+    """Threshold an image (path or PIL image) to a bit-plane.
+
+    Returns the bits packed eight per byte (np.packbits order), or a 0/1
+    array with packed=False - never a '0'/'1' string.
+    """
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    bits = (np.asarray(image.convert('L')) > threshold).astype(np.uint8).reshape(-1)
+    return np.packbits(bits) if packed else bits
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'messengersecret.metrics.MetricsMiddleware',  # Removed at startup unless METRICS_ENABLED=1
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,7 +58,6 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -64,6 +65,14 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compile each template once per process, with DEBUG on as well;
+            # the dev server's autoreloader still resets it when a template changes
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -117,6 +126,18 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic writes content-hashed names (used by {% static %} when DEBUG
+# is off) plus .gz/.br variants (.br needs the optional brotli package)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'messengersecret.static_assets.CompressedManifestStaticFilesStorage'},
+}
+
+# Serve STATIC_ROOT from Django with precompressed variants and immutable
+# caching, for deployments without a front-end server for /static/
+STATIC_SERVE_COMPRESSED = os.environ.get('STATIC_SERVE_COMPRESSED', '').lower() in ('1', 'true', 'yes', 'on')
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -131,3 +152,33 @@ LOGOUT_REDIRECT_URL = '/'
 SESSION_COOKIE_AGE = 1209600  # 2 weeks in seconds
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 SESSION_SAVE_EVERY_REQUEST = False
+
+# Decoded message cache (per process) used by chat_view
+DECODED_MESSAGE_CACHE_MAX_ENTRIES = 5000
+DECODED_MESSAGE_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# User identity cache (per process): email/username -> (id, username, user_hash)
+IDENTITY_CACHE_MAX_ENTRIES = 10000
+IDENTITY_CACHE_TTL = 300  # seconds; bounds staleness across processes
+
+# Background encryption workers
+ENCRYPTION_WORKER_PROCESSES = 2  # 0 = encode in a single background thread instead
+ENCRYPTION_QUEUE_SIZE = 64  # Max messages queued or being encrypted at once
+ENCRYPTION_SATURATED_POLICY = 'plain'  # 'plain' keeps the message unencrypted, 'reject' refuses the send
+ENCRYPTION_STARTUP_SWEEP = True  # Re-enqueue unencrypted rows left over from a crash
+ENCRYPTION_SWEEP_LOCK_FILE = BASE_DIR / 'encryption-sweep.lock'  # Only the process holding it sweeps
+
+# Messages rendered per conversation page; older pages load on demand
+CHAT_PAGE_SIZE = 50
+# Long-poll for new messages: max seconds a request waits on PUBSUB_HUB.
+# InProcessHub only wakes waiters in the sending process; use a broker-backed
+# hub when running several server processes.
+CHAT_LONG_POLL_MAX_WAIT = 25
+
+# Real-time push (Server-Sent Events over ASGI)
+PUBSUB_HUB = 'messengersecret.pubsub.InProcessHub'  # Any PubSubHub implementation
+CHAT_EVENTS_KEEPALIVE = 15  # Seconds between SSE keepalive comments
+
+# Instrumentation: timings and counters at /stats/metrics/ when the
+# METRICS_ENABLED=1 environment variable is set (see messengersecret/metrics.py)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Bearer token for scrapers; staff sessions always allowed
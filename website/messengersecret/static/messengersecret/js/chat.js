@@ -0,0 +1,180 @@
+// Auto-scroll to bottom of messages
+const messagesArea = document.getElementById('messages');
+if (messagesArea) {
+    messagesArea.scrollTop = messagesArea.scrollHeight;
+}
+
+// Load older pages of the conversation on demand (keyset cursor)
+function buildMessageElement(message) {
+    const div = document.createElement('div');
+    div.className = 'message ' + (message.own ? 'own' : 'other');
+    [['sender', message.sender], ['content', message.content], ['timestamp', message.timestamp_display]]
+        .forEach(function(part) {
+            const child = document.createElement('div');
+            child.className = part[0];
+            child.textContent = part[1];
+            div.appendChild(child);
+        });
+    return div;
+}
+
+const loadOlderBtn = document.getElementById('loadOlder');
+if (loadOlderBtn && messagesArea) {
+    loadOlderBtn.addEventListener('click', function() {
+        const cursor = messagesArea.dataset.olderCursor;
+        if (!cursor) {
+            return;
+        }
+        loadOlderBtn.disabled = true;
+        fetch(messagesArea.dataset.olderUrl + '?before=' + encodeURIComponent(cursor), {
+            headers: {'Accept': 'application/json'},
+            credentials: 'same-origin'
+        })
+            .then(function(response) {
+                if (!response.ok) {
+                    throw new Error('HTTP ' + response.status);
+                }
+                return response.json();
+            })
+            .then(function(data) {
+                // Keep the viewport anchored while content is prepended
+                const previousHeight = messagesArea.scrollHeight;
+                const fragment = document.createDocumentFragment();
+                data.messages.forEach(function(message) {
+                    fragment.appendChild(buildMessageElement(message));
+                });
+                loadOlderBtn.after(fragment);
+                messagesArea.scrollTop += messagesArea.scrollHeight - previousHeight;
+
+                messagesArea.dataset.olderCursor = data.older_cursor || '';
+                if (data.older_cursor) {
+                    loadOlderBtn.disabled = false;
+                } else {
+                    loadOlderBtn.remove();
+                }
+            })
+            .catch(function(error) {
+                loadOlderBtn.disabled = false;
+                showModal('Could not load older messages: ' + error.message);
+            });
+    });
+}
+
+// Append new messages as they arrive instead of reloading the page:
+// Server-Sent Events when served over ASGI, long-polling otherwise
+function appendNewMessages(newMessages) {
+    const latestId = Number(messagesArea.dataset.latestId);
+    const fresh = newMessages.filter(function(message) { return message.id > latestId; });
+    if (!fresh.length) {
+        return;
+    }
+    const nearBottom = messagesArea.scrollHeight - messagesArea.scrollTop - messagesArea.clientHeight < 80;
+    const empty = messagesArea.querySelector('.empty-messages');
+    if (empty) {
+        empty.remove();
+    }
+    fresh.forEach(function(message) {
+        if (message.own === undefined) {
+            message.own = message.sender === messagesArea.dataset.username;
+        }
+        messagesArea.appendChild(buildMessageElement(message));
+    });
+    messagesArea.dataset.latestId = fresh[fresh.length - 1].id;
+    if (nearBottom) {
+        messagesArea.scrollTop = messagesArea.scrollHeight;
+    }
+}
+
+function fetchNewMessages(wait) {
+    const url = messagesArea.dataset.sinceUrl + '?after=' + messagesArea.dataset.latestId + '&wait=' + wait;
+    return fetch(url, {headers: {'Accept': 'application/json'}, credentials: 'same-origin'})
+        .then(function(response) {
+            if (!response.ok) {
+                throw new Error('HTTP ' + response.status);
+            }
+            return response.json();
+        })
+        .then(function(data) {
+            appendNewMessages(data.messages);
+        });
+}
+
+function pollNewMessages() {
+    fetchNewMessages(25)
+        .then(pollNewMessages)
+        .catch(function() {
+            // Back off on errors (server restart, network drop)
+            setTimeout(pollNewMessages, 5000);
+        });
+}
+
+function streamNewMessages() {
+    const source = new EventSource(messagesArea.dataset.eventsUrl);
+    // Catch up on anything sent while (re)connecting
+    source.addEventListener('open', function() { fetchNewMessages(0).catch(function() {}); });
+    source.addEventListener('resync', function() { fetchNewMessages(0).catch(function() {}); });
+    source.addEventListener('message', function(event) {
+        appendNewMessages([JSON.parse(event.data).message]);
+    });
+    source.addEventListener('error', function() {
+        // CLOSED means the server refused the stream (e.g. WSGI); reconnects stay CONNECTING
+        if (source.readyState === EventSource.CLOSED) {
+            pollNewMessages();
+        }
+    });
+}
+
+if (messagesArea && messagesArea.dataset.sinceUrl) {
+    if (window.EventSource) {
+        streamNewMessages();
+    } else {
+        pollNewMessages();
+    }
+}
+
+// Focus on textarea when page loads
+const contentTextarea = document.getElementById('id_content');
+if (contentTextarea) {
+    contentTextarea.focus();
+}
+
+// Modal management functions
+function showModal(message) {
+    const modal = document.getElementById('errorModal');
+    const errorMessage = document.getElementById('errorMessage');
+    if (errorMessage) {
+        errorMessage.textContent = message;
+    }
+    if (modal) {
+        modal.style.display = 'block';
+        modal.focus();
+    }
+}
+
+function closeModal() {
+    const modal = document.getElementById('errorModal');
+    if (modal) {
+        modal.style.display = 'none';
+    }
+}
+
+// Close modal when clicking outside
+window.onclick = function(event) {
+    const modal = document.getElementById('errorModal');
+    if (event.target === modal) {
+        modal.style.display = 'none';
+    }
+}
+
+// Check for error messages on page load and show modal
+document.addEventListener('DOMContentLoaded', function() {
+    // Error messages are rendered into a hidden container by the template
+    const container = document.getElementById('djangoMessages');
+    const errorMessages = container ? container.querySelectorAll('.django-message[data-tags="error"]') : [];
+    if (errorMessages.length > 0) {
+        const message = errorMessages[0].getAttribute('data-message');
+        if (message) {
+            showModal(message);
+        }
+    }
+});
@@ -0,0 +1,34 @@
+// Password strength indicator
+document.addEventListener('DOMContentLoaded', function() {
+    const passwordInput = document.getElementById('id_password1');
+    const strengthBar = document.getElementById('strength-bar');
+    const signupBtn = document.getElementById('signup-btn');
+
+    passwordInput.addEventListener('input', function() {
+        const password = this.value;
+        let strength = 0;
+
+        if (password.length >= 8) strength += 25;
+        if (/[A-Z]/.test(password)) strength += 25;
+        if (/[a-z]/.test(password)) strength += 25;
+        if (/[0-9]/.test(password)) strength += 15;
+        if (/[^A-Za-z0-9]/.test(password)) strength += 10;
+
+        strengthBar.className = 'strength-bar';
+
+        if (strength < 40) {
+            strengthBar.classList.add('strength-weak');
+        } else if (strength < 70) {
+            strengthBar.classList.add('strength-medium');
+        } else {
+            strengthBar.classList.add('strength-strong');
+        }
+
+        // Update button based on password strength
+        if (password.length >= 8) {
+            signupBtn.disabled = false;
+        } else {
+            signupBtn.disabled = true;
+        }
+    });
+});
@@ -0,0 +1,148 @@
+"""Fingerprinted, precompressed static assets and a view that serves them.
+
+CompressedManifestStaticFilesStorage is ManifestStaticFilesStorage (content
+hash in every file name, resolved by {% static %}) plus precompression:
+collectstatic also writes a .gz next to each hashed text asset, and a .br
+when the optional brotli package is installed. A variant is only kept if
+it is meaningfully smaller than the original.
+
+serve() is for deployments without a front-end server doing this job
+(STATIC_SERVE_COMPRESSED). It picks the best variant the client accepts
+and marks hashed names as immutable for a year - the name changes whenever
+the content does, so browsers never need to revalidate.
+"""
+import gzip
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are written without it
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.xml')
+MIN_COMPRESS_BYTES = 256
+MIN_SAVING = 0.05  # keep a variant only if it saves at least 5%
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+UNHASHED_MAX_AGE = 60
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _compressed_variants(content: bytes):
+    """(suffix, bytes) for each encoding that is worth keeping"""
+    limit = len(content) * (1 - MIN_SAVING)
+    variants = []
+    if brotli is not None:
+        encoded = brotli.compress(content, quality=11)
+        if len(encoded) < limit:
+            variants.append(('.br', encoded))
+    # mtime=0 keeps the output reproducible between builds
+    encoded = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(encoded) < limit:
+        variants.append(('.gz', encoded))
+    return variants
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Hash files missing from the manifest on the fly rather than failing
+    manifest_strict = False
+
+    def stored_name(self, name):
+        # A file that was never collected (test runs, DEBUG off without
+        # collectstatic) keeps its unhashed name instead of a 500 on every page
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in self.hashed_files.values():
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS) or not self.exists(name):
+                continue
+            with self.open(name) as original:
+                content = original.read()
+            if len(content) < MIN_COMPRESS_BYTES:
+                continue
+            for suffix, encoded in _compressed_variants(content):
+                variant = name + suffix
+                if self.exists(variant):
+                    self.delete(variant)
+                self._save(variant, ContentFile(encoded))
+                yield variant, variant, True
+
+
+def _accepted_encodings(request):
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _is_hashed(path):
+    # Names from the manifest carry the content hash; originals do not
+    return path in _hashed_names()
+
+
+_hashed = None
+
+
+def _hashed_names():
+    global _hashed
+    if _hashed is None:
+        hashed_files = getattr(staticfiles_storage, 'hashed_files', {}) or {}
+        _hashed = frozenset(hashed_files.values())
+    return _hashed
+
+
+def serve(request, path):
+    """Serve a collected static file, precompressed and with long-lived caching"""
+    if path.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+        raise Http404("Compressed variants are not served directly")
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except ValueError:
+        raise Http404("Invalid path")
+    if not os.path.isfile(fullpath):
+        raise Http404(f"{path} not found")
+
+    content_type, _ = mimetypes.guess_type(fullpath)
+    accepted = _accepted_encodings(request)
+    chosen, encoding = fullpath, None
+    for coding, suffix in ENCODINGS:
+        if coding in accepted and os.path.isfile(fullpath + suffix):
+            chosen, encoding = fullpath + suffix, coding
+            break
+
+    stat = os.stat(chosen)
+    hashed = _is_hashed(path)
+    if not hashed and request.META.get('HTTP_IF_MODIFIED_SINCE') == http_date(stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(chosen, 'rb'), content_type=content_type or 'application/octet-stream')
+        response['Content-Length'] = stat.st_size
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if hashed:
+        response['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = f'public, max-age={UNHASHED_MAX_AGE}'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -0,0 +1,279 @@
+import io
+import time
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from PIL import Image
+
+from . import frame, rangecoder
+from .bitplane import embed_bytes
+from .carriers import generate_carrier
+from .encoding import RANGE_SIGNATURE, ImageSteganography
+from .identity_cache import Identity, IdentityCache
+from .models import Message
+from .views import encode_cursor
+from .management.commands.check_query_plans import full_scan_pattern, hot_path_queries
+
+
+class QueryPlanTests(TestCase):
+    """The chat hot path must be served from indexes, never a full table scan"""
+
+    def test_hot_path_queries_use_indexes(self):
+        pattern = full_scan_pattern()
+        for name, queryset in hot_path_queries().items():
+            with self.subTest(query=name):
+                plan = queryset.explain()
+                self.assertIsNone(pattern.search(plan), f'{name} scans a whole table:\n{plan}')
+
+
+class RangeCoderTests(SimpleTestCase):
+    def test_round_trip(self):
+        for data in (b'', b'a', bytes(range(256)) * 4, b'abracadabra' * 300):
+            with self.subTest(length=len(data)):
+                self.assertEqual(rangecoder.decompress(rangecoder.compress(data)), data)
+
+    def test_untrusted_streams_fail_fast(self):
+        compressed = rangecoder.compress(b'\x00' * 100000)
+        cases = {
+            'shorter than the header': b'garbage',
+            'arbitrary bytes': bytes(range(256)) * 8,
+            'over max_length': compressed,
+            'truncated': rangecoder.compress(bytes(range(256)) * 200)[:3000],
+        }
+        for name, data in cases.items():
+            with self.subTest(name):
+                start = time.perf_counter()
+                with self.assertRaises(ValueError):
+                    rangecoder.decompress(data, max_length=len(data) * 16)
+                self.assertLess(time.perf_counter() - start, 1.0)
+
+
+class StoredPayloadTests(SimpleTestCase):
+    def setUp(self):
+        self.codec = ImageSteganography()
+
+    def test_non_png_payloads_fail_fast(self):
+        for data in (b'xor-fallback bytes that are not a png', b'garbage', b'aGVsbG8gd29ybGQ=' * 100):
+            with self.subTest(data=data[:20]):
+                start = time.perf_counter()
+                with self.assertRaises(ValueError):
+                    self.codec.decode_message(data)
+                self.assertLess(time.perf_counter() - start, 1.0)
+
+    def test_range_coded_payloads_are_marked(self):
+        data = b'\x89PNG\r\n\x1a\n' + b'\x00' * 4000
+        stored = self.codec._compress_with_range_encoding(data)
+        self.assertTrue(stored.startswith(RANGE_SIGNATURE))
+        self.assertEqual(self.codec._decompress_with_range_encoding(stored), data)
+
+
+class PageRenderTests(TestCase):
+    """Pages render with DEBUG off and no collectstatic run (as under the test runner)"""
+
+    def test_login_page_renders(self):
+        response = self.client.get(reverse('login'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'messengersecret/css/login.css')
+
+    def test_chat_page_renders(self):
+        User = get_user_model()
+        alice = User.objects.create_user('alice', 'alice@example.com', 'pw-alice-123')
+        User.objects.create_user('bob', 'bob@example.com', 'pw-bob-123')
+        self.client.force_login(alice)
+        for url in (reverse('chat'), reverse('chat_with_user', args=['bob'])):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+
+SENDER_HASH = 'a1b2c3d4e5f60718293a4b5c6d7e8f90abcdef1234567890abcdef1234567890'
+RECEIVER_HASH = '0f1e2d3c4b5a69788796a5b4c3d2e1f0fedcba0987654321fedcba0987654321'
+
+
+def png_bytes(pixels):
+    out = io.BytesIO()
+    Image.fromarray(pixels).save(out, format='PNG')
+    return out.getvalue()
+
+
+def legacy_image(message, shape=(48, 64, 3)):
+    """Stored bytes as the pre-frame encoder wrote them: 8 bits per character
+    (ord, so Latin-1), then a zero byte as the delimiter"""
+    bits = ''.join(format(ord(char), '08b') for char in message) + '00000000'
+    flat = generate_carrier(0, shape).copy().reshape(-1)
+    for i, bit in enumerate(bits):
+        flat[i] = (int(flat[i]) & ~1) | int(bit)
+    return png_bytes(flat.reshape(shape))
+
+
+def legacy_reference_bytes(stored):
+    """The pre-frame decoder's bit-by-bit scan: stop at the first run of 8 zero bits"""
+    flat = np.array(Image.open(io.BytesIO(stored))).flatten()
+    binary = ''
+    for pixel in flat:
+        binary += str(pixel & 1)
+        if len(binary) >= 8 and binary[-8:] == '00000000':
+            break
+    return bytes(int(binary[i:i + 8], 2) for i in range(0, len(binary) - 8, 8))
+
+
+class FrameFormatTests(SimpleTestCase):
+    def setUp(self):
+        self.codec = ImageSteganography()
+
+    def test_framed_round_trip(self):
+        messages = {
+            'ascii': 'hello',
+            'nul bytes': 'before\x00middle\x00\x00after\x00',
+            'non-latin-1': 'Grüße, 日本語, Ελληνικά 🎉',
+            'compressible': 'see you at 6, ok? ' * 200,
+        }
+        for name, message in messages.items():
+            with self.subTest(name):
+                stored = self.codec.encode_message(message, SENDER_HASH, RECEIVER_HASH)
+                self.assertEqual(self.codec.decode_message(stored, SENDER_HASH, RECEIVER_HASH), message)
+                self.assertEqual(self.codec.frame_version(stored), frame.FRAME_VERSION)
+
+    def test_legacy_delimiter_images_decode_as_before(self):
+        for message in ('hello world', 'caf\xe9 na\xefve \xbfqu\xe9?', 'a'):
+            with self.subTest(message=message):
+                stored = legacy_image(message)
+                expected = legacy_reference_bytes(stored)
+                self.assertEqual(expected, message.encode('latin-1'))
+                self.assertEqual(self.codec.decode_message(stored).encode('latin-1'), expected)
+
+    def test_frame_version_is_zero_for_legacy_rows(self):
+        self.assertEqual(self.codec.frame_version(legacy_image('legacy row')), 0)
+
+    def test_bad_checksum_raises(self):
+        payload = frame.pack(b'hello, checksum')
+        corrupted = bytearray(payload)
+        corrupted[-1] ^= 0x01
+        pixels = generate_carrier(0, (24, 32, 3)).copy()
+        embed_bytes(pixels.reshape(-1), bytes(corrupted))
+        with self.assertRaisesRegex(ValueError, 'checksum'):
+            self.codec.decode_message(png_bytes(pixels))
+        with self.assertRaises(ValueError):
+            frame.verify(frame.parse_header(payload), bytes(corrupted[frame.HEADER_SIZE:]))
+
+    def test_truncated_frame_raises(self):
+        payload = frame.pack(b'hello, truncation')
+        header = frame.parse_header(payload)
+        with self.assertRaisesRegex(ValueError, 'Truncated'):
+            frame.verify(header, payload[frame.HEADER_SIZE:-3])
+
+        # Header promising more payload than the image holds
+        pixels = generate_carrier(0, (24, 32, 3)).copy()
+        embed_bytes(pixels.reshape(-1), frame.HEADER.pack(frame.MAGIC, frame.FRAME_VERSION, frame.CODEC_RAW,
+                                                          100000, 0))
+        with self.assertRaises(ValueError):
+            self.codec.decode_message(png_bytes(pixels))
+
+        # Stored bytes cut short
+        stored = self.codec.encode_message('cut short', SENDER_HASH, RECEIVER_HASH)
+        with self.assertRaises(ValueError):
+            self.codec.decode_message(stored[:len(stored) // 2], SENDER_HASH, RECEIVER_HASH)
+
+
+@override_settings(CHAT_PAGE_SIZE=3)
+class OlderMessagesTests(TestCase):
+    """Keyset pagination of /chat/<contact>/older/ on (timestamp, id)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pw-alice-123')
+        User.objects.create_user('bob', 'bob@example.com', 'pw-bob-123')
+        User.objects.create_user('carol', 'carol@example.com', 'pw-carol-123')
+        # Only three distinct timestamps for 8 messages, so most page
+        # boundaries fall inside a run of identical timestamps
+        base = timezone.now().replace(microsecond=0)
+        cls.conversation_ids = []
+        for i in range(8):
+            timestamp = base + timezone.timedelta(seconds=i // 3)
+            for contact in ('bob', 'carol'):
+                sender, receiver = ('alice', contact) if i % 2 else (contact, 'alice')
+                msg = Message.objects.create(sender=sender, receiver=receiver, content=f'{contact} {i}',
+                                             sender_hash='s', receiver_hash='r', encryption_bypassed=True)
+                Message.objects.filter(id=msg.id).update(timestamp=timestamp)
+                if contact == 'bob':
+                    cls.conversation_ids.append(msg.id)
+
+    def setUp(self):
+        self.client.force_login(self.alice)
+        self.url = reverse('older_messages', args=['bob'])
+
+    def walk_pages(self):
+        pages = []
+        params = {}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            pages.append([m['id'] for m in data['messages']])
+            if data['older_cursor'] is None:
+                return pages
+            params = {'before': data['older_cursor']}
+            self.assertLess(len(pages), 10, 'pagination does not terminate')
+
+    def test_pages_cover_conversation_once_despite_timestamp_ties(self):
+        pages = self.walk_pages()
+        self.assertEqual([len(page) for page in pages], [3, 3, 2])
+        walked = [message_id for page in reversed(pages) for message_id in page]
+        self.assertEqual(walked, self.conversation_ids)
+
+    def test_last_page_has_no_older_cursor(self):
+        second_oldest = Message.objects.get(id=self.conversation_ids[1])
+        data = self.client.get(self.url, {'before': encode_cursor(second_oldest)}).json()
+        self.assertEqual([m['id'] for m in data['messages']], self.conversation_ids[:1])
+        self.assertIsNone(data['older_cursor'])
+
+    def test_pages_never_include_other_conversations(self):
+        keys = set()
+        for page in self.walk_pages():
+            keys.update(Message.objects.filter(id__in=page).values_list('conversation_key', flat=True))
+        self.assertEqual(keys, {Message.make_conversation_key('alice', 'bob')})
+
+    def test_malformed_cursor_is_rejected(self):
+        for cursor in ('not base64!', 'bm8tc2VwYXJhdG9y', 'eHx5'):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(self.url, {'before': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+
+class IdentityCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = IdentityCache(max_entries=10, ttl=60)
+        self.loads = 0
+
+    def loader(self, identity, during_load=None):
+        def load():
+            self.loads += 1
+            if during_load:
+                during_load()
+            return identity
+        return load
+
+    def test_hits_are_served_from_cache(self):
+        alice = Identity(1, 'alice', 'alice@example.com', 1, 'hash-1')
+        for _ in range(3):
+            self.assertEqual(self.cache._get(('id', 1), self.loader(alice)), alice)
+        self.assertEqual(self.loads, 1)
+
+    def test_invalidation_during_load_is_not_undone(self):
+        stale = Identity(1, 'alice', 'old@example.com', 1, 'hash-1')
+        fresh = stale._replace(email='new@example.com')
+        # post_save fires while the (now stale) row is being read
+        loaded = self.cache._get(('id', 1), self.loader(stale, lambda: self.cache.invalidate(1)))
+        self.assertEqual(loaded, stale)
+        self.assertEqual(self.cache._get(('id', 1), self.loader(fresh)), fresh)
+        self.assertEqual(self.loads, 2)
+
+    def test_clear_during_load_is_not_undone(self):
+        stale = Identity(2, 'bob', 'bob@example.com', 2, 'hash-2')
+        self.cache._get(('id', 2), self.loader(stale, self.cache.clear))
+        self.assertEqual(self.cache.stats()['entries'], 0)
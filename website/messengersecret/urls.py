@@ -14,17 +14,27 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path
-from . import views
+from django.urls import path, re_path
+from . import static_assets, views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('login/', views.login_view, name='login'),
     path('signup/', views.signup_view, name='signup'),
     path('logout/', views.logout_view, name='logout'),
+    path('stats/decoded-cache/', views.decoded_cache_stats, name='decoded_cache_stats'),
+    path('stats/metrics/', views.metrics_view, name='metrics'),
     path('chat/', views.chat_view, name='chat'),  # Contact list with email input
     path('chat/<str:contact_email>/', views.chat_view, name='chat_with_user'),  # P2P chat
+    path('chat/<str:contact_email>/older/', views.older_messages, name='older_messages'),  # Older pages (JSON)
+    path('chat/<str:contact_email>/since/', views.messages_since, name='messages_since'),  # New messages (JSON, long-poll)
+    path('chat/<str:contact_email>/events/', views.conversation_events, name='conversation_events'),  # SSE push (ASGI)
     path('chat/clear/', views.clear_messages, name='clear_messages'),
     path('', views.landing_view, name='landing'),  # Landing page as root
 ]
+
+if getattr(settings, 'STATIC_SERVE_COMPRESSED', False):
+    urlpatterns.append(
+        re_path(rf'^{settings.STATIC_URL.strip("/")}/(?P<path>.*)$', static_assets.serve, name='static_compressed'))
@@ -1,17 +1,32 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
-from django.contrib.auth.models import User
-from .models import Message, UserProfile, Contact
+from .models import Message, UserProfile, Contact, ConversationSummary
+from django.db import transaction
 from django.db.models import Q
 from django.db.utils import OperationalError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.defaultfilters import date as date_filter
 import datetime
-from .encoding import encoding, decoding
+import time
+from .encoding import encoding, decoding, decoding_many
+from .message_cache import decoded_cache, content_digest
+from .identity_cache import identity_cache, as_user, attach_profile
+from .workers import get_worker_pool
+from .pubsub import get_hub, conversation_channel, publish_conversation_event
+from . import metrics
+from asgiref.sync import sync_to_async
+import asyncio
+import json
 import logging
 import base64
-import threading
+import binascii
+import hmac
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +51,121 @@ def decode_message(message, sender_hash, receiver_hash):
     
     return decoded_message
 
+def encode_cursor(msg):
+    """Opaque keyset cursor for a message's (timestamp, id) position"""
+    raw = f"{msg.timestamp.isoformat()}|{msg.id}"
+    return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on malformed input"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii')
+        timestamp, message_id = raw.rsplit('|', 1)
+        return datetime.datetime.fromisoformat(timestamp), int(message_id)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+def conversation_messages(user, contact):
+    """All messages between two users, unordered (served by message_conv_ts_id_idx)"""
+    return Message.objects.filter(
+        conversation_key=Message.make_conversation_key(user.username, contact.username)
+    )
+
+def conversation_page(user, contact, page_size, before=None):
+    """Up to page_size messages older than `before` (all when None), oldest first.
+
+    Keyset pagination on (timestamp, id): returns the page plus a cursor for
+    the next older page, or None when there is nothing older.
+    """
+    qs = conversation_messages(user, contact)
+    if before is not None:
+        timestamp, message_id = before
+        qs = qs.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id))
+    # Fetch one extra row to learn whether an older page exists
+    rows = list(qs.order_by('-timestamp', '-id')[:page_size + 1])
+    has_more = len(rows) > page_size
+    page = rows[:page_size][::-1]
+    older_cursor = encode_cursor(page[0]) if has_more else None
+    return page, older_cursor
+
+def display_messages(msgs):
+    """Decode stored messages (through the plaintext cache) for rendering, in order.
+
+    Cache misses are decoded together with one decode_many() call.
+    """
+    decoded = {}
+    misses = []
+    for msg in msgs:
+        if not msg.is_encrypted:
+            decoded[msg.id] = msg.content
+            continue
+        digest = content_digest(msg.stored_body())
+        cached = decoded_cache.get(msg.id, digest)
+        if cached is not None:
+            decoded[msg.id] = cached
+            continue
+        try:
+            # Binary column for new rows, base64 content for legacy rows
+            misses.append((msg, digest, msg.encrypted_bytes()))
+        except Exception as e:
+            decoded[msg.id] = f"[Encryption decoding failed: {str(e)}]"
+            logger.error(f"Failed to read encrypted message {msg.id}: {e}")
+
+    if misses:
+        results = decoding_many([(data, msg.sender_hash, msg.receiver_hash) for msg, _, data in misses])
+        for (msg, digest, _), result in zip(misses, results):
+            if result.ok:
+                decoded[msg.id] = result.value
+                decoded_cache.put(msg.id, digest, result.value)
+            else:
+                # If decoding fails, show error message
+                decoded[msg.id] = f"[Encryption decoding failed: {str(result.error)}]"
+                metrics.incr('message_decode_failures')
+                logger.error(f"Failed to decode encrypted message {msg.id}: {result.error}")
+
+    return [message_dict(msg, decoded[msg.id]) for msg in msgs]
+
+def display_message(msg):
+    """Decode a single stored message for rendering"""
+    return display_messages([msg])[0]
+
+def message_dict(msg, decoded_content):
+    return {
+        'id': msg.id,
+        'sender': msg.sender,
+        'receiver': msg.receiver,
+        'content': decoded_content,
+        'timestamp': msg.timestamp,
+        'sender_hash': msg.sender_hash,
+        'receiver_hash': msg.receiver_hash
+    }
+
+def messages_after(user, contact, after_id):
+    """Messages in the conversation with id > after_id, in index order"""
+    return conversation_messages(user, contact).filter(id__gt=after_id).order_by('timestamp', 'id')
+
+def message_json(message, user=None):
+    """JSON shape of a display_message() dict, as used by the chat page scripts.
+
+    Without a user (pushed events go to both participants) 'own' is left
+    for the client to work out from the sender.
+    """
+    data = {
+        'id': message['id'],
+        'sender': message['sender'],
+        'content': message['content'],
+        'timestamp': message['timestamp'].isoformat(),
+        'timestamp_display': date_filter(message['timestamp'], "M d, Y H:i"),
+    }
+    if user is not None:
+        data['own'] = message['sender'] == user.username
+    return data
+
+def find_user(identifier):
+    """Look a user up by email, falling back to username (through the identity cache)"""
+    identity = identity_cache.lookup(identifier)
+    return as_user(identity) if identity else None
+
 @login_required
 def chat_view(request, contact_email=None):
     """P2P chat view - show conversation with specific contact or contact list"""
@@ -49,10 +179,7 @@ def chat_view(request, contact_email=None):
     contact = None
     if contact_email:
         # Try to find user by email or username for backward compatibility
-        contact = User.objects.filter(email=contact_email).first()
-        if not contact:
-            # Fallback to username if no email match
-            contact = User.objects.filter(username=contact_email).first()
+        contact = find_user(contact_email)
 
         if not contact:
             messages.error(request, f"User with email '{contact_email}' not found.")
@@ -71,21 +198,19 @@ def chat_view(request, contact_email=None):
         if content and receiver:
             # Message send from contact chat
             receiver_username = receiver
-            receiver_user = User.objects.filter(username=receiver_username).first()
+            receiver_identity = identity_cache.by_username(receiver_username)
 
-            if not receiver_user:
+            if not receiver_identity:
                 messages.error(request, f"User '{receiver_username}' not found.")
                 return redirect('chat')
 
+            receiver_user = as_user(receiver_identity)
             if receiver_user == request.user:
                 messages.error(request, "You cannot send messages to yourself.")
                 return redirect('chat')
 
-            # Get or create user profile for current user
-            sender_profile, created = UserProfile.objects.get_or_create(user=request.user)
-
-            # Get or create user profile for receiver
-            receiver_profile, created = UserProfile.objects.get_or_create(user=receiver_user)
+            # Cached identities carry the hashes; profiles are created on first use
+            sender_identity = identity_cache.by_id(request.user.id)
 
             # Ensure explicit Contact records exist for both directions
             try:
@@ -95,40 +220,47 @@ def chat_view(request, contact_email=None):
                 # If contact creation fails, still proceed
                 logger.exception('Failed to create Contact rows for %s <-> %s', request.user.username, receiver_user.username)
 
-            # Create message immediately with plain text
-            msg = Message.objects.create(
-                sender=request.user.username,
-                receiver=receiver_user.username,
-                sender_hash=sender_profile.user_hash,
-                receiver_hash=receiver_profile.user_hash,
-                content=content,  # Plain text initially
-                is_encrypted=False  # Will be updated by background thread
-            )
-
             # Check for encryption bypass
             bypass_encryption = request.POST.get('bypass_encryption') == 'on'
+
+            # Under the 'reject' policy take a queue slot before anything is written,
+            # so a refused send leaves no row, summary update or pushed event behind
+            pool = get_worker_pool()
+            reserved = (not bypass_encryption
+                        and getattr(settings, 'ENCRYPTION_SATURATED_POLICY', 'plain') == 'reject')
+            if reserved and not pool.reserve():
+                messages.error(request, "The server is busy encrypting messages. Please try again.")
+                return redirect('chat_with_user', contact_email=receiver_user.username)
+
+            # Create message immediately with plain text, and update both
+            # conversation summaries in the same transaction
+            try:
+                with transaction.atomic():
+                    msg = Message.objects.create(
+                        sender=request.user.username,
+                        receiver=receiver_user.username,
+                        sender_hash=sender_identity.user_hash,
+                        receiver_hash=receiver_identity.user_hash,
+                        content=content,  # Plain text initially
+                        is_encrypted=False,  # Will be updated by the encryption workers
+                        encryption_bypassed=bypass_encryption
+                    )
+                    ConversationSummary.record_message(msg, request.user, receiver_user)
+                    # Push to open conversation streams once the row is visible
+                    event = {'type': 'message', 'message': message_json(display_message(msg))}
+                    transaction.on_commit(lambda: publish_conversation_event(msg.conversation_key, event))
+            except Exception:
+                if reserved:
+                    pool.release_reservation()
+                raise
+
             if not bypass_encryption:
-                # Start background thread for complex encryption
-                def encrypt_message_background(message_id, plain_text, sender_hash, receiver_hash):
-                    try:
-                        encoded_bytes = encode_message(plain_text, sender_hash, receiver_hash)
-                        encrypted_content = base64.b64encode(encoded_bytes).decode('ascii')
-                        # Update the message with encrypted content
-                        Message.objects.filter(id=message_id).update(
-                            content=encrypted_content,
-                            is_encrypted=True
-                        )
-                        logger.info(f"Background encryption completed for message {message_id}")
-                    except Exception as e:
-                        logger.error(f"Background encryption failed for message {message_id}: {e}")
-
-                # Start encryption thread
-                encryption_thread = threading.Thread(
-                    target=encrypt_message_background,
-                    args=(msg.id, content, sender_profile.user_hash, receiver_profile.user_hash)
-                )
-                encryption_thread.daemon = True  # Don't keep app alive if main thread dies
-                encryption_thread.start()
+                # Hand off to the shared worker pool; it refuses work when saturated
+                queued = pool.submit(
+                    msg.id, content, sender_identity.user_hash, receiver_identity.user_hash, reserved=reserved)
+                if not queued:
+                    # Left as plain text; the startup sweep encrypts it later
+                    logger.warning(f"Encryption queue full, message {msg.id} kept as plain text")
 
             messages.success(request, f"Message sent to {receiver_user.username}!")
             return redirect('chat_with_user', contact_email=receiver_user.username)
@@ -136,10 +268,7 @@ def chat_view(request, contact_email=None):
         elif receiver_email:
             # Contact add from start conversation form
             # Find receiver by email or username
-            receiver_user = User.objects.filter(email=receiver_email).first()
-            if not receiver_user:
-                # Fallback to username if no email match
-                receiver_user = User.objects.filter(username=receiver_email).first()
+            receiver_user = find_user(receiver_email)
 
             if not receiver_user:
                 messages.error(request, f"User '{receiver_email}' not found.")
@@ -153,6 +282,7 @@ def chat_view(request, contact_email=None):
             try:
                 Contact.objects.get_or_create(user=request.user, contact=receiver_user)
                 Contact.objects.get_or_create(user=receiver_user, contact=request.user)
+                ConversationSummary.ensure_pair(request.user, receiver_user)
             except Exception:
                 # If contact creation fails, still proceed
                 logger.exception('Failed to create Contact rows for %s <-> %s', request.user.username, receiver_user.username)
@@ -165,58 +295,39 @@ def chat_view(request, contact_email=None):
             messages.error(request, "Invalid request.")
             return redirect('chat')
 
-    # Prefer explicit Contact relations (new, reliable method)
+    # One indexed query over the conversation summaries, most recent first
     try:
-        contact_user_qs = Contact.objects.filter(user=request.user).values_list('contact_id', flat=True)
-        contacts = list(User.objects.filter(id__in=contact_user_qs))
+        summaries = (ConversationSummary.objects.filter(user=request.user)
+                     .select_related('contact__profile').order_by('-last_message_at'))
+        contacts = []
+        for summary in summaries:
+            summary.contact.unread_count = summary.unread_count
+            summary.contact.last_message_at = summary.last_message_at
+            contacts.append(summary.contact)
     except OperationalError:
-        # The Contact table may not exist yet (migrations not applied).
-        # Fall back to deriving contacts from Message records so the app stays usable
+        # The summary table may not exist yet (migrations not applied)
         contacts = []
 
-    # Backwards-compatible fallback: derive contacts from Message records if no explicit contacts
-    if not contacts:
-        sent_usernames = Message.objects.filter(sender=request.user.username).values_list('receiver', flat=True)
-        received_usernames = Message.objects.filter(receiver=request.user.username).values_list('sender', flat=True)
-        contact_usernames = set(sent_usernames) | set(received_usernames)
-        contact_usernames.discard(request.user.username)
-        contacts = list(User.objects.filter(username__in=contact_usernames))
+    # Sender hash shown in the header, without a profile query
+    sender_identity = identity_cache.by_id(request.user.id)
+    if sender_identity:
+        attach_profile(request.user, sender_identity)
 
     # Get messages for P2P conversation
     if contact:
-        conversation_messages = Message.objects.filter(
-            (Q(sender=request.user.username) & Q(receiver=contact.username)) |
-            (Q(sender=contact.username) & Q(receiver=request.user.username))
-        ).order_by('timestamp')
-
-        decoded_messages = []
-        for msg in conversation_messages:
-            if msg.is_encrypted:
-                try:
-                    # Decode base64 to bytes first, then decode the encrypted content
-                    encrypted_bytes = base64.b64decode(msg.content.encode('ascii'))
-                    decoded_content = decode_message(encrypted_bytes, msg.sender_hash, msg.receiver_hash)
-                except Exception as e:
-                    # If decoding fails, show error message
-                    decoded_content = f"[Encryption decoding failed: {str(e)}]"
-                    logger.exception(f"Failed to decode encrypted message: {e}")
-            else:
-                decoded_content = msg.content
-            decoded_messages.append({
-                'id': msg.id,
-                'sender': msg.sender,
-                'receiver': msg.receiver,
-                'content': decoded_content,
-                'timestamp': msg.timestamp,
-                'sender_hash': msg.sender_hash,
-                'receiver_hash': msg.receiver_hash
-            })
+        # Only the latest page is decoded and rendered; older pages load on demand
+        page_size = getattr(settings, 'CHAT_PAGE_SIZE', 50)
+        page, older_cursor = conversation_page(request.user, contact, page_size)
+        decoded_messages = display_messages(page)
+        ConversationSummary.mark_read(request.user, contact)
 
         context = {
             'messages': decoded_messages,
             'contact': contact,
             'user': request.user,
             'contacts': contacts,
+            'older_cursor': older_cursor,
+            'latest_id': page[-1].id if page else 0,
             'is_p2p': True
         }
     else:
@@ -229,16 +340,150 @@ def chat_view(request, contact_email=None):
             'is_p2p': False
         }
 
-    return render(request, 'messengersecret/chat.html', context)
+    with metrics.span('template_render'):
+        return render(request, 'messengersecret/chat.html', context)
+
+@login_required
+def older_messages(request, contact_email):
+    """JSON page of messages older than the `before` cursor"""
+    contact = find_user(contact_email)
+    if not contact or contact == request.user:
+        return JsonResponse({'error': 'Unknown contact'}, status=404)
+
+    before = None
+    if request.GET.get('before'):
+        try:
+            before = decode_cursor(request.GET['before'])
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+    page_size = getattr(settings, 'CHAT_PAGE_SIZE', 50)
+    page, older_cursor = conversation_page(request.user, contact, page_size, before)
+    return JsonResponse({
+        'messages': [message_json(m, request.user) for m in display_messages(page)],
+        'older_cursor': older_cursor,
+    })
+
+@login_required
+async def messages_since(request, contact_email):
+    """JSON list of messages newer than the `after` id, optionally long-polling.
+
+    With ?wait=<seconds> the request is held until a new message arrives or
+    the timeout (capped by CHAT_LONG_POLL_MAX_WAIT) passes. The wait is on
+    the pub/sub hub, not a DB polling loop, and ties up no worker thread.
+    """
+    user = await request.auser()
+    contact = await sync_to_async(find_user)(contact_email)
+    if not contact or contact == user:
+        return JsonResponse({'error': 'Unknown contact'}, status=404)
+
+    try:
+        after = int(request.GET.get('after', 0))
+        wait = min(float(request.GET.get('wait', 0)), getattr(settings, 'CHAT_LONG_POLL_MAX_WAIT', 25))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid after/wait parameter'}, status=400)
+
+    page_size = getattr(settings, 'CHAT_PAGE_SIZE', 50)
+    fetch = sync_to_async(lambda: list(messages_after(user, contact, after)[:page_size]))
+    if wait > 0:
+        # Subscribe before the first query so a message sent in between is not missed
+        channel = conversation_channel(Message.make_conversation_key(user.username, contact.username))
+        subscription = get_hub().subscribe(channel)
+        try:
+            new_messages = await fetch()
+            deadline = time.monotonic() + wait
+            while not new_messages:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                if event['type'] in ('message', 'resync'):
+                    new_messages = await fetch()
+        finally:
+            subscription.close()
+    else:
+        new_messages = await fetch()
+
+    if any(msg.sender == contact.username for msg in new_messages):
+        await sync_to_async(ConversationSummary.mark_read)(user, contact)
+    displayed = await sync_to_async(display_messages)(new_messages)
+    return JsonResponse({
+        'messages': [message_json(m, user) for m in displayed],
+        'cursor': new_messages[-1].id if new_messages else after,
+    })
+
+async def conversation_events(request, contact_email):
+    """Server-Sent Events stream of one conversation's push events.
+
+    Only served over ASGI: an endless response would pin a WSGI worker, so
+    there the client gets a 501 and falls back to long-polling. Idle streams
+    just wait on the pub/sub hub and make no DB queries.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("Event stream requires the ASGI server", status=501, content_type='text/plain')
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=403)
+    contact = await sync_to_async(find_user)(contact_email)
+    if not contact or contact == user:
+        return JsonResponse({'error': 'Unknown contact'}, status=404)
+
+    channel = conversation_channel(Message.make_conversation_key(user.username, contact.username))
+    keepalive = getattr(settings, 'CHAT_EVENTS_KEEPALIVE', 15)
+
+    async def stream():
+        subscription = get_hub().subscribe(channel)
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                if event['type'] == 'message' and event['message']['sender'] == contact.username:
+                    await sync_to_async(ConversationSummary.mark_read)(user, contact)
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 @login_required
 def clear_messages(request):
     """View to clear all messages"""
     if request.method == 'POST':
         Message.objects.all().delete()
+        ConversationSummary.objects.update(last_message_at=None, unread_count=0)
+        decoded_cache.clear()
         messages.success(request, "All messages cleared!")
     return redirect('chat')
 
+@staff_member_required
+def decoded_cache_stats(request):
+    """Hit/miss counters for this process's decoded-message cache"""
+    return JsonResponse(decoded_cache.stats())
+
+def metrics_view(request):
+    """Prometheus text metrics; staff session or `Authorization: Bearer <METRICS_TOKEN>`"""
+    if not metrics.enabled:
+        return HttpResponse('Metrics are disabled (set METRICS_ENABLED=1)', status=404, content_type='text/plain')
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    authorized = request.user.is_authenticated and request.user.is_staff
+    if not authorized and token:
+        # Constant-time comparison so response timing does not leak the token
+        authorized = hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                         f'Bearer {token}'.encode())
+    if not authorized:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 def landing_view(request):
     """Landing page for non-authenticated users"""
     if request.user.is_authenticated:
@@ -0,0 +1,273 @@
+"""Bounded worker pool for background message encryption.
+
+Encoding is CPU-bound NumPy/PIL work, so it runs in a small process pool
+rather than a thread per message. At most ``max_pending`` jobs are queued
+or running; past that, submit() returns False and the caller decides
+whether to keep the message as plain text or reject it. Finished payloads
+are written back by a single writer thread in the web process.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.utils import OperationalError
+
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:  # no flock (Windows): every process sweeps
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def encrypt_payload(plain_text, sender_hash, receiver_hash):
+    """Worker-side job: steganographically encode one message.
+
+    Returns (encoded bytes, metrics snapshot or None); the snapshot carries
+    the worker's timing spans back to the web process.
+    """
+    from .encoding import encoding
+    if not metrics.enabled:
+        return encoding(plain_text, sender_hash, receiver_hash), None
+    with metrics.collect() as local:
+        with metrics.span('encryption_job'):
+            encoded = encoding(plain_text, sender_hash, receiver_hash)
+    return encoded, local.snapshot()
+
+
+def reencode_batch(items, force=False):
+    """Worker-side job for the reencrypt_messages command.
+
+    items are (message_id, plain_text, stored_bytes, sender_hash, receiver_hash);
+    plain_text is None for rows that are already encrypted, which are
+    decoded first and re-encoded only if not in the current frame format
+    (or force is set). Returns (message_id, new_bytes or None, error or None)
+    per item, where None/None means the row is already current.
+    """
+    from .encoding import ImageSteganography
+    from .frame import FRAME_VERSION
+    codec = ImageSteganography()
+    results = []
+    for message_id, plain_text, stored, sender_hash, receiver_hash in items:
+        try:
+            if plain_text is None:
+                if not force and codec.frame_version(stored) == FRAME_VERSION:
+                    results.append((message_id, None, None))
+                    continue
+                plain_text = codec.decode_message(stored, sender_hash, receiver_hash)
+            results.append((message_id, codec.encode_message(plain_text, sender_hash, receiver_hash), None))
+        except Exception as e:
+            results.append((message_id, None, f'{type(e).__name__}: {e}'))
+    return results
+
+
+def store_encrypted_payload(message_id, encoded_bytes):
+    """Write an encoded payload back to its Message row"""
+    from .models import Message
+    from .message_cache import decoded_cache
+    from .pubsub import publish_conversation_event
+
+    Message.objects.filter(id=message_id).update(
+        content='',
+        payload=encoded_bytes,
+        is_encrypted=True
+    )
+    decoded_cache.invalidate(message_id)
+    conversation_key = Message.objects.filter(id=message_id).values_list('conversation_key', flat=True).first()
+    publish_conversation_event(conversation_key, {'type': 'encrypted', 'id': message_id})
+
+
+class EncryptionWorkerPool:
+    def __init__(self, processes=2, max_pending=64):
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        if processes > 0:
+            # spawn, not fork: the web process already runs threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='encrypt')
+        self._results = queue.Queue()
+        self._writer = threading.Thread(target=self._write_results, name='encrypt-writer', daemon=True)
+        self._writer.start()
+
+    @property
+    def pending(self) -> int:
+        """Jobs queued or running"""
+        return self._pending
+
+    def reserve(self) -> bool:
+        """Take a queue slot ahead of submit(..., reserved=True); False if saturated or closed.
+
+        Lets a caller refuse work before it creates anything. A reservation
+        that ends up unused must be given back with release_reservation().
+        """
+        if self._closed or not self._slots.acquire(blocking=False):
+            metrics.incr('encryption_rejected')
+            return False
+        return True
+
+    def release_reservation(self):
+        self._slots.release()
+
+    def submit(self, message_id, plain_text, sender_hash, receiver_hash, block=False, reserved=False) -> bool:
+        """Queue a message for encryption; False if the pool is saturated or closed.
+
+        With reserved=True the slot taken by reserve() is used (and given
+        back if the job cannot be queued).
+        """
+        if reserved:
+            if self._closed:
+                self._slots.release()
+                return False
+        elif self._closed or not self._slots.acquire(blocking=block):
+            metrics.incr('encryption_rejected')
+            return False
+        try:
+            future = self._executor.submit(encrypt_payload, plain_text, sender_hash, receiver_hash)
+        except RuntimeError:
+            # Executor already shut down
+            self._slots.release()
+            return False
+        with self._lock:
+            self._pending += 1
+        submitted = time.monotonic()
+        future.add_done_callback(lambda f: self._results.put((message_id, f, submitted)))
+        return True
+
+    def _write_results(self):
+        while True:
+            item = self._results.get()
+            if item is None:
+                break
+            message_id, future, submitted = item
+            try:
+                encoded, worker_metrics = future.result()
+                if worker_metrics:
+                    metrics.registry.merge(worker_metrics)
+                with metrics.span('encryption_store'):
+                    store_encrypted_payload(message_id, encoded)
+                metrics.incr('encryption_completed')
+                metrics.observe('encryption_lag', time.monotonic() - submitted)
+                logger.debug(f"Background encryption completed for message {message_id}")
+            except Exception as e:
+                metrics.incr('encryption_failed')
+                logger.error(f"Background encryption failed for message {message_id}: {e}")
+            finally:
+                with self._lock:
+                    self._pending -= 1
+                self._slots.release()
+                close_old_connections()
+
+    def shutdown(self, wait=True):
+        """Stop accepting work, let running jobs finish and flush their results"""
+        if self._closed:
+            return
+        self._closed = True
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+        self._results.put(None)
+        if wait:
+            self._writer.join()
+
+
+def requeue_unencrypted(pool):
+    """Re-submit rows left plain by a crash or a saturated queue, oldest first"""
+    from .models import Message
+
+    try:
+        return _requeue(pool, Message)
+    except OperationalError:
+        # Tables not migrated yet; nothing to sweep
+        logger.warning("Skipping unencrypted message sweep: database not ready")
+        return 0
+    finally:
+        close_old_connections()
+
+
+def _requeue(pool, Message):
+    requeued = 0
+    last_id = 0
+    pending = Message.objects.filter(is_encrypted=False, encryption_bypassed=False).exclude(content='')
+    while True:
+        batch = list(pending.filter(id__gt=last_id).order_by('id')
+                     .only('id', 'content', 'sender_hash', 'receiver_hash')[:100])
+        if not batch:
+            break
+        for m in batch:
+            # Wait for a free slot instead of dropping sweep work
+            if not pool.submit(m.id, m.content, m.sender_hash, m.receiver_hash, block=True):
+                return requeued
+            requeued += 1
+        last_id = batch[-1].id
+    if requeued:
+        logger.info(f"Re-enqueued {requeued} unencrypted messages")
+    return requeued
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> EncryptionWorkerPool:
+    """Process-wide pool, created on first use and shut down at exit"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = EncryptionWorkerPool(
+                    processes=getattr(settings, 'ENCRYPTION_WORKER_PROCESSES', 2),
+                    max_pending=getattr(settings, 'ENCRYPTION_QUEUE_SIZE', 64),
+                )
+                atexit.register(_pool.shutdown)
+                metrics.register_gauge('encryption_queue_depth', lambda: _pool.pending)
+    return _pool
+
+
+_sweep_claim = None
+
+
+def claim_sweep() -> bool:
+    """True if this process should run the startup sweep.
+
+    Every server process calls start_workers(); without a claim each of them
+    would re-encode the same leftover rows. The claim is an exclusive flock
+    on ENCRYPTION_SWEEP_LOCK_FILE held for the life of the process. The OS
+    drops it when the process exits, so the next process started after a
+    crash takes it over and sweeps what the dead one left queued.
+    """
+    global _sweep_claim
+    if _sweep_claim is not None:
+        return True
+    if fcntl is None:
+        return True
+    path = (getattr(settings, 'ENCRYPTION_SWEEP_LOCK_FILE', None)
+            or os.path.join(settings.BASE_DIR, 'encryption-sweep.lock'))
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        logger.debug("Unencrypted message sweep is claimed by another process")
+        return False
+    _sweep_claim = lock_file
+    return True
+
+
+def start_workers():
+    """Called from the WSGI/ASGI entry points: start the pool and sweep leftovers"""
+    pool = get_worker_pool()
+    if getattr(settings, 'ENCRYPTION_STARTUP_SWEEP', True) and claim_sweep():
+        threading.Thread(target=requeue_unencrypted, args=(pool,), name='encrypt-sweep', daemon=True).start()
+    return pool
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'messengersecret.settings')
 
 application = get_wsgi_application()
+
+# Start background encryption workers once the app registry is ready
+from messengersecret.workers import start_workers  # noqa: E402
+
+start_workers()